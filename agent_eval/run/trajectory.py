@@ -142,30 +142,35 @@ def collect_trajectory(session_id: str, directory: str, prompt: str,
     except requests.HTTPError:
         raw_diff = None
 
-    # Parse messages into structured trajectory steps
-    messages = [_parse_message(m) for m in raw_messages]
-
-    # Compute stats from messages
+    # Parse messages and aggregate stats/tokens in a single pass
+    messages = []
     tool_calls = []
     reasoning_steps = []
-    for m in messages:
-        for p in m["parts"]:
-            if p["type"] == "tool_call":
-                tool_calls.append(p)
-            elif p["type"] == "reasoning":
-                reasoning_steps.append(p)
-
     tool_summary = {}
-    for tc in tool_calls:
-        name = tc["tool_name"]
-        tool_summary[name] = tool_summary.get(name, 0) + 1
-
+    user_messages = 0
+    assistant_messages = 0
     total_tokens = 0
     prompt_tokens = 0
     completion_tokens = 0
     cache_read_tokens = 0
     cache_write_tokens = 0
-    for m in messages:
+    for raw_msg in raw_messages:
+        m = _parse_message(raw_msg)
+        messages.append(m)
+
+        if m["role"] == "user":
+            user_messages += 1
+        elif m["role"] == "assistant":
+            assistant_messages += 1
+
+        for p in m["parts"]:
+            if p["type"] == "tool_call":
+                tool_calls.append(p)
+                name = p["tool_name"]
+                tool_summary[name] = tool_summary.get(name, 0) + 1
+            elif p["type"] == "reasoning":
+                reasoning_steps.append(p)
+
         info = m.get("info") if isinstance(m.get("info"), dict) else {}
         tokens = info.get("tokens") if isinstance(info.get("tokens"), dict) else None
         if tokens:
@@ -237,8 +242,8 @@ def collect_trajectory(session_id: str, directory: str, prompt: str,
         # ── Agent behavior stats ──
         "stats": {
             "total_messages": len(messages),
-            "user_messages": sum(1 for m in messages if m["role"] == "user"),
-            "assistant_messages": sum(1 for m in messages if m["role"] == "assistant"),
+            "user_messages": user_messages,
+            "assistant_messages": assistant_messages,
             "total_tool_calls": len(tool_calls),
             "tool_call_breakdown": tool_summary,
             "failed_tool_calls": sum(
@@ -2,6 +2,7 @@
 
 import os
 import json
+import stat
 import subprocess
 import textwrap
 
@@ -25,6 +26,7 @@ from agent_eval.run.git_helpers import (
     _SANITIZE_SIDECAR,
 )
 from agent_eval.run.patch_utils import get_patch, has_repo_changes, validate_patch
+from agent_eval.run.trajectory import _parse_message
 
 
 # ---------------------------------------------------------------------------
@@ -83,6 +85,24 @@ def _branch(path):
     ).stdout.strip()
 
 
+_DIR_RWX = stat.S_IRWXU
+_FILE_RW = stat.S_IRUSR | stat.S_IWUSR
+
+
+def _unlock_tree(root):
+    """Make every dir/file under *root* owner-writable (single scandir pass)."""
+    os.chmod(root, _DIR_RWX)
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    os.chmod(entry.path, _DIR_RWX)
+                    stack.append(entry.path)
+                else:
+                    os.chmod(entry.path, _FILE_RW)
+
+
 def _make_patch(path, changes, msg="fix"):
     """Apply changes (dict of relpath→content) and return the patch text."""
     for relpath, content in changes.items():
@@ -1530,73 +1550,56 @@ class TestBackupDirValidation:
 class TestTrajectoryParsing:
     """Tests for trajectory.py handling of malformed server messages."""
 
-    def test_parse_message_non_dict_info(self):
-        """_parse_message handles info as a string without crashing."""
-        from agent_eval.run.trajectory import _parse_message
-
-        msg = {"role": "assistant", "info": "not-a-dict", "parts": []}
-        result = _parse_message(msg)
-
-        assert result["role"] == "assistant"
-        assert result["info"] == {}  # non-dict info is replaced with {}
-
-    def test_parse_message_info_null(self):
-        """_parse_message handles info as None."""
-        from agent_eval.run.trajectory import _parse_message
-
-        msg = {"info": None, "parts": []}
-        result = _parse_message(msg)
-
-        assert result["role"] == "?"
-        assert result["info"] == {}
-
-    def test_parse_message_role_from_dict_info(self):
-        """_parse_message extracts role from dict info when top-level is absent."""
-        from agent_eval.run.trajectory import _parse_message
-
-        msg = {"info": {"role": "assistant"}, "parts": []}
+    @pytest.mark.parametrize("msg,expect", [
+        pytest.param({"role": "assistant", "info": "not-a-dict", "parts": []},
+                     {"role": "assistant", "info": {}}, id="non-dict-info"),
+        pytest.param({"info": None, "parts": []},
+                     {"role": "?", "info": {}}, id="info-null"),
+        pytest.param({"info": {"role": "assistant"}, "parts": []},
+                     {"role": "assistant"}, id="role-from-dict-info"),
+        pytest.param("bad-item", {"role": "?", "parts": []}, id="non-dict-msg-str"),
+        pytest.param(42, {"role": "?"}, id="non-dict-msg-int"),
+        pytest.param({"role": "assistant", "parts": "oops"},
+                     {"role": "assistant", "parts": []}, id="non-list-parts"),
+    ])
+    def test_parse_message_variants(self, msg, expect):
+        """_parse_message tolerates malformed messages, info, and parts."""
         result = _parse_message(msg)
+        for key, value in expect.items():
+            assert result[key] == value
 
-        assert result["role"] == "assistant"
-
-    def test_token_aggregation_with_non_dict_info(self):
+    def test_token_aggregation_with_non_dict_info(self, monkeypatch, tmp_path):
         """Token aggregation in collect_trajectory doesn't crash when a
         parsed message has non-dict info (belt-and-suspenders test)."""
-        from agent_eval.run.trajectory import _parse_message
-
-        # Simulate what collect_trajectory does with parsed messages
-        messages = [
-            _parse_message({"role": "user", "info": "bad", "parts": []}),
-            _parse_message({"role": "assistant",
-                            "info": {"totalTokens": 100},
-                            "parts": []}),
-        ]
-
-        total = 0
-        for m in messages:
-            info = m.get("info") if isinstance(m.get("info"), dict) else {}
-            total += info.get("totalTokens", 0)
-
-        assert total == 100
-
-    def test_parse_message_non_dict_msg(self):
-        """_parse_message handles a non-dict message (e.g. string) gracefully."""
-        from agent_eval.run.trajectory import _parse_message
-
-        result = _parse_message("bad-item")
-        assert result["role"] == "?"
-        assert result["parts"] == []
+        from agent_eval.run import trajectory as tmod
 
-        result2 = _parse_message(42)
-        assert result2["role"] == "?"
+        def fake_request(method, path, **kwargs):
+            if "/message" in path:
+                return [
+                    {"role": "user", "info": "bad", "parts": []},
+                    {"role": "assistant", "info": {"totalTokens": 100},
+                     "parts": [{"type": "tool", "name": "bash",
+                                "state": {"status": "completed"}}]},
+                ]
+            if "/session/" in path and "/diff" not in path:
+                return {"model": "test-model"}
+            return None
 
-    def test_parse_message_non_list_parts(self):
-        """_parse_message handles parts as a non-list (e.g. string) gracefully."""
-        from agent_eval.run.trajectory import _parse_message
+        monkeypatch.setattr(tmod, "opencode_request", fake_request)
 
-        result = _parse_message({"role": "assistant", "parts": "oops"})
-        assert result["role"] == "assistant"
-        assert result["parts"] == []
+        t = 1000.0
+        result = tmod.collect_trajectory(
+            session_id="s1", directory=str(tmp_path), prompt="test",
+            agent="build", patch="", health={"version": "1"},
+            t_start=t, t_session_created=t, t_task_sent=t,
+            t_task_done=t, t_end=t + 1,
+        )
+        assert result["token_usage"]["total_tokens"] == 100
+        assert result["stats"]["total_messages"] == 2
+        assert result["stats"]["user_messages"] == 1
+        assert result["stats"]["assistant_messages"] == 1
+        assert result["stats"]["tool_call_breakdown"] == {"bash": 1}
+        assert [m["role"] for m in result["trajectory"]] == ["user", "assistant"]
 
     def test_parse_part_non_dict(self):
         """_parse_part handles a non-dict part element gracefully."""
@@ -1611,8 +1614,6 @@ class TestTrajectoryParsing:
 
     def test_parse_message_mixed_parts(self):
         """_parse_message handles a parts list with mixed dict/non-dict items."""
-        from agent_eval.run.trajectory import _parse_message
-
         msg = {
             "role": "assistant",
             "parts": [
@@ -1721,16 +1722,10 @@ class TestTrajectoryParsing:
 
         # Attacker unlocks backup, plants a malicious .git/config backup,
         # and adds .git/config to pre_agent_ignored in the sidecar.
-        import stat, shutil
-
         # Unlock sidecar and ignored/ tree for tampering (same OS user)
         sidecar_path = os.path.join(backup_dir, "sidecar.json")
-        os.chmod(sidecar_path, stat.S_IRUSR | stat.S_IWUSR)
-        ignored_root = os.path.join(backup_dir, "ignored")
-        for root, dirs, files in os.walk(ignored_root):
-            os.chmod(root, stat.S_IRWXU)
-            for fn in files:
-                os.chmod(os.path.join(root, fn), stat.S_IRUSR | stat.S_IWUSR)
+        os.chmod(sidecar_path, _FILE_RW)
+        _unlock_tree(os.path.join(backup_dir, "ignored"))
 
         # Plant malicious backup
         malicious_git_dir = os.path.join(backup_dir, "ignored", ".git")
@@ -1765,56 +1760,47 @@ class TestTrajectoryParsing:
 # Server response validation
 # ===========================================================================
 
-class TestServerResponseValidation:
-    """Tests for check_health and create_session handling of malformed responses."""
+@pytest.fixture
+def patched_oc(monkeypatch):
+    """Return apply(resp), which stubs opencode_request and returns the opencode_client module."""
+    from agent_eval.run import opencode_client as oc
 
-    def test_check_health_non_dict(self, monkeypatch):
-        """check_health raises RuntimeError on non-dict response."""
-        from agent_eval.run import opencode_client as oc
+    def _apply(resp):
+        monkeypatch.setattr(oc, "opencode_request", lambda *a, **kw: resp)
+        return oc
+    return _apply
 
-        monkeypatch.setattr(oc, "opencode_request", lambda *a, **kw: "text-health")
-        with pytest.raises(RuntimeError, match="expected dict"):
-            oc.check_health()
 
-    def test_check_health_none(self, monkeypatch):
-        """check_health raises RuntimeError on None response."""
-        from agent_eval.run import opencode_client as oc
+class TestServerResponseValidation:
+    """Tests for check_health and create_session handling of malformed responses."""
 
-        monkeypatch.setattr(oc, "opencode_request", lambda *a, **kw: None)
+    @pytest.mark.parametrize("resp", [
+        pytest.param("text-health", id="non-dict"),
+        pytest.param(None, id="none"),
+        pytest.param(42, id="int"),
+    ])
+    def test_check_health_invalid(self, patched_oc, resp):
+        """check_health raises RuntimeError on non-dict responses."""
+        oc = patched_oc(resp)
         with pytest.raises(RuntimeError, match="expected dict"):
             oc.check_health()
 
-    def test_check_health_valid(self, monkeypatch):
+    def test_check_health_valid(self, patched_oc):
         """check_health works normally with a valid dict response."""
-        from agent_eval.run import opencode_client as oc
-
-        monkeypatch.setattr(oc, "opencode_request",
-                            lambda *a, **kw: {"version": "1.0"})
-        result = oc.check_health()
-        assert result == {"version": "1.0"}
-
-    def test_create_session_non_dict(self, monkeypatch):
-        """create_session raises RuntimeError on non-dict response."""
-        from agent_eval.run import opencode_client as oc
-
-        monkeypatch.setattr(oc, "opencode_request", lambda *a, **kw: "text-session")
-        with pytest.raises(RuntimeError, match="expected dict with 'id'"):
-            oc.create_session("/tmp/test")
-
-    def test_create_session_missing_id(self, monkeypatch):
-        """create_session raises RuntimeError when dict has no 'id' key."""
-        from agent_eval.run import opencode_client as oc
-
-        monkeypatch.setattr(oc, "opencode_request",
-                            lambda *a, **kw: {"foo": "bar"})
+        oc = patched_oc({"version": "1.0"})
+        assert oc.check_health() == {"version": "1.0"}
+
+    @pytest.mark.parametrize("resp", [
+        pytest.param("text-session", id="non-dict"),
+        pytest.param({"foo": "bar"}, id="missing-id"),
+    ])
+    def test_create_session_invalid(self, patched_oc, resp):
+        """create_session raises RuntimeError on non-dict or id-less responses."""
+        oc = patched_oc(resp)
         with pytest.raises(RuntimeError, match="expected dict with 'id'"):
             oc.create_session("/tmp/test")
 
-    def test_create_session_valid(self, monkeypatch):
+    def test_create_session_valid(self, patched_oc):
         """create_session works normally with a valid response."""
-        from agent_eval.run import opencode_client as oc
-
-        monkeypatch.setattr(oc, "opencode_request",
-                            lambda *a, **kw: {"id": "sess-123"})
-        result = oc.create_session("/tmp/test")
-        assert result == "sess-123"
+        oc = patched_oc({"id": "sess-123"})
+        assert oc.create_session("/tmp/test") == "sess-123"
@@ -2,8 +2,6 @@
 
 import argparse
 
-from .app import build_ui, APP_CSS
-
 
 def main():
     parser = argparse.ArgumentParser(description="Trajectory Insight Finder")
@@ -11,7 +9,12 @@ def main():
     parser.add_argument("--share", action="store_true", help="Create a public Gradio link")
     args = parser.parse_args()
 
+    # Deferred so ``--help`` returns without importing Gradio/Plotly.
+    from .app import build_ui, APP_CSS
+
     app = build_ui()
+    # Queueing streams do_load's staged (generator) updates over websocket
+    app.queue()
     app.launch(
         server_port=args.port,
         share=args.share,
@@ -0,0 +1,56 @@
+"""Server-side downsampling for long per-step chart series.
+
+Implements Largest-Triangle-Three-Buckets (LTTB), the same selection rule
+plotly-resampler uses, so that very long trajectories send a bounded number
+of points to the browser while keeping the visual shape of each series.
+"""
+
+from collections.abc import Iterable, Sequence
+
+import numpy as np
+
+# Series longer than this are reduced to RESAMPLE_TARGET points.
+RESAMPLE_THRESHOLD = 2000
+RESAMPLE_TARGET = 1500
+
+
+def lttb(values: Sequence[float], n_out: int = RESAMPLE_TARGET,
+         keep: Iterable[int] = (), keep_top: int = 10) -> list[int]:
+    """Return sorted indices of the points LTTB keeps from *values*.
+
+    x is the position in the sequence.  The first and last points are
+    always kept, as are the *keep_top* largest values and any explicit
+    *keep* indices (e.g. annotated outliers), so spikes never disappear.
+    Returns every index when the series is already short enough.
+    """
+    n = len(values)
+    if n_out >= n or n_out < 3:
+        return list(range(n))
+
+    y = np.asarray(values, dtype=float)
+    x = np.arange(n, dtype=float)
+    # n_out - 2 buckets spanning the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+
+    kept = np.empty(n_out, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo = hi
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        ax, ay = x[a], y[a]
+        # Twice the triangle area (a, b, c) for every candidate b in the bucket
+        d = np.column_stack((x[lo:hi] - ax, y[lo:hi] - ay))
+        area = np.abs(np.einsum("ij,j->i", d, (cy - ay, ax - cx)))
+        a = lo + int(area.argmax())
+        kept[i + 1] = a
+
+    forced = list(keep)
+    if keep_top > 0:
+        k = min(keep_top, n)
+        forced.extend(np.argpartition(y, n - k)[n - k:].tolist())
+    if forced:
+        kept = np.union1d(kept, np.asarray(forced, dtype=np.intp))
+    return kept.tolist()
@@ -1,12 +1,22 @@
 """Per-step analytics, phase detection, and behavioral insights."""
 
+import math
+import statistics
+from array import array
+from itertools import pairwise
+
 from .data import infer_non_cache_input
 
+_CLOSE_FINISHES = frozenset(("stop", "end_turn"))
+
 
 def compute_step_analytics(steps: list[dict]) -> list[dict]:
     """Compute derived per-message metrics aligned 1:1 with steps."""
     analytics: list[dict] = []
     for i, step in enumerate(steps):
+        sget = step.get
+        tok = step["tokens"]
+        parts = step["parts"]
         duration_s = step["duration"]
 
         # Tool time: naive sum of individual tool call durations (may overcount parallel calls)
@@ -21,17 +31,17 @@ def compute_step_analytics(steps: list[dict]) -> list[dict]:
         if duration_s is not None and duration_s > 0:
             tool_time_share = round(tool_time_ms / (duration_s * 1000), 4)
 
-        tok_total = step["tokens"]["total"]
-        cache_read = step["tokens"]["cache_read"]
+        tok_total = tok["total"]
+        cache_read = tok["cache_read"]
 
         tok_per_s = None
         if duration_s is not None and duration_s > 0:
             tok_per_s = round(tok_total / duration_s, 1)
 
         cache_ratio = round(cache_read / tok_total, 4) if tok_total > 0 else 0.0
-        input_tok = step["tokens"]["input"]
-        output_tok = step["tokens"]["output"]
-        reasoning_tok = step["tokens"]["reasoning"]
+        input_tok = tok["input"]
+        output_tok = tok["output"]
+        reasoning_tok = tok["reasoning"]
         non_cache_tok = infer_non_cache_input(
             total_tokens=tok_total,
             input_tokens=input_tok,
@@ -41,15 +51,15 @@ def compute_step_analytics(steps: list[dict]) -> list[dict]:
         )
         out_in_ratio = round(output_tok / input_tok, 4) if input_tok > 0 else None
 
-        # Sorted unique part types
-        part_types = sorted({p.get("type", "") for p in step["parts"]} - {""})
-        part_mix = ",".join(part_types)
+        # Sorted unique part types (empty types filtered inline)
+        part_types = {t for p in parts if (t := p.get("type"))}
+        part_mix = ",".join(sorted(part_types))
 
         # Idle gap from previous step
         idle_before_s = None
         if i > 0:
             prev_completed = steps[i - 1].get("time_completed_ms")
-            this_created = step.get("time_created_ms")
+            this_created = sget("time_created_ms")
             if (isinstance(prev_completed, (int, float))
                     and isinstance(this_created, (int, float))):
                 idle_before_s = round((this_created - prev_completed) / 1000, 2)
@@ -57,8 +67,8 @@ def compute_step_analytics(steps: list[dict]) -> list[dict]:
         analytics.append({
             "index": step["index"],
             "role": step["role"],
-            "agent": step.get("agent", ""),
-            "model_id": step.get("model_id", ""),
+            "agent": sget("agent", ""),
+            "model_id": sget("model_id", ""),
             "duration_s": duration_s,
             "tool_time_ms": tool_time_ms,
             "tool_time_share": tool_time_share,
@@ -115,11 +125,12 @@ def detect_phases(analytics: list[dict]) -> list[dict]:
 
     # Closeout: trailing steps with finish=stop/end_turn or no tools + high tokens
     avg_tok = total_tok / len(analytics)
+    boot_lower = (boot_end or 0) + 1
     closeout_start = None
-    for i in range(len(analytics) - 1, max(0, (boot_end or 0) + 1) - 1, -1):
+    for i in range(len(analytics) - 1, boot_lower - 1, -1):
         a = analytics[i]
         is_close = (
-            (a["finish"] in ("stop", "end_turn") or a["tool_calls"] == 0)
+            (a["finish"] in _CLOSE_FINISHES or a["tool_calls"] == 0)
             and a["tok_total"] > avg_tok
         )
         if is_close:
@@ -173,14 +184,16 @@ def generate_insights(
             "No step has tool_time_share > 50%.")
 
     # 2. Cache behavior
-    crs = [a["cache_ratio"] for a in asst if a["tok_total"] > 0]
+    crs: list[float] = []
+    min_cr, min_step = None, None
+    for a in asst:
+        if a["tok_total"] > 0:
+            cr = a["cache_ratio"]
+            crs.append(cr)
+            if min_cr is None or cr < min_cr:
+                min_cr, min_step = cr, a["index"]
     if crs:
-        sorted_crs = sorted(crs)
-        med_cr = sorted_crs[len(sorted_crs) // 2]
-        min_cr = sorted_crs[0]
-        min_step = next(
-            a["index"] for a in asst
-            if a["tok_total"] > 0 and a["cache_ratio"] == min_cr)
+        med_cr = statistics.median_high(crs)
         insights.append(
             f"Cache behavior: median cache read = {med_cr * 100:.1f}%. "
             f"Lowest: step {min_step} ({min_cr * 100:.1f}%).")
@@ -200,21 +213,24 @@ def generate_insights(
     # 4. High-token turns near end
     sorted_by_tok = sorted(asst, key=lambda a: -a["tok_total"])
     top_tok = sorted_by_tok[:3]
-    late = [a for a in top_tok if a["index"] >= len(analytics) * 0.7]
+    # Indices are ints, so ceil() keeps the original ">= 70% of length" semantics
+    late_cutoff_idx = math.ceil(len(analytics) * 0.7)
+    late = [a for a in top_tok if a["index"] >= late_cutoff_idx]
     if late:
         ex = ", ".join(
             f"step {a['index']} ({a['tok_total']:,} tok)" for a in late)
         insights.append(f"Largest token turns near end: {ex}.")
 
     # 5. Context escalation — monotonically increasing input tokens
-    asst_toks = [a["tok_total"] for a in asst if a["tok_total"] > 0]
+    asst_toks = array("d", (a["tok_total"] for a in asst if a["tok_total"] > 0))
     if len(asst_toks) >= 4:
         increasing_run = 1
         max_run = 1
-        for i in range(1, len(asst_toks)):
-            if asst_toks[i] >= asst_toks[i - 1]:
+        for prev, cur in pairwise(asst_toks):
+            if cur >= prev:
                 increasing_run += 1
-                max_run = max(max_run, increasing_run)
+                if increasing_run > max_run:
+                    max_run = increasing_run
             else:
                 increasing_run = 1
         if max_run >= 4:
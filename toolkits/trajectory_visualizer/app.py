@@ -1,12 +1,18 @@
 """Gradio UI for trajectory visualization."""
 
 import base64
+import functools
 import html
 import json
 import os
 import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import chain
 
 import gradio as gr
+import orjson
 import plotly.graph_objects as go
 
 from .data import (
@@ -24,13 +30,42 @@ from .charts import (
     build_cache_ratio_chart, build_efficiency_chart,
     build_analytics_heatmap, build_phase_chart,
     build_context_growth_chart,
-    build_tool_duration_chart,
+    build_tool_duration_chart, _empty_figure,
 )
 from .rendering import render_workflow_html, format_step_detail
 from .styles import APP_CSS
 
 _DETAIL_PLACEHOLDER = "<div id='wf-detail-content'><em>Click a step card to inspect details.</em></div>"
 
+# Shared blank figure for every chart slot in error/empty states; never mutated
+_EMPTY_FIG = _empty_figure(380)
+
+_WORKFLOW_TAB = "Workflow"
+_RAW_TAB = "Raw Data"
+_RAW_PREVIEW_LINES = 2000
+_ORJSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+
+def _serialize_raw(raw: dict, max_lines: int = _RAW_PREVIEW_LINES) -> str:
+    """Pretty-print the raw trajectory for the Raw Data tab, stopping after *max_lines*.
+
+    Encodes with orjson and only decodes the bytes that make it into the
+    preview; the complete file is offered via the download button instead.
+    """
+    try:
+        encoded = orjson.dumps(raw, default=str, option=_ORJSON_OPTS)
+    except TypeError:
+        # orjson rejects e.g. integers wider than 64 bits
+        encoded = json.dumps(raw, indent=2, ensure_ascii=False, default=str).encode()
+    cut = -1
+    for _ in range(max_lines):
+        cut = encoded.find(b"\n", cut + 1)
+        if cut < 0:
+            return encoded.decode()
+    return (encoded[:cut].decode()
+            + f"\n\n... (preview truncated at {max_lines} lines; "
+            "use \"Download full JSON\" for the complete file)")
+
 
 def _prerender_step_details(steps: list[dict]) -> str:
     """Pre-render all step details as HTML and return a base64-encoded JSON blob.
@@ -45,6 +80,87 @@ def _prerender_step_details(steps: list[dict]) -> str:
     return f'<div data-b64="{b64}" style="display:none"></div>'
 
 
+@dataclass(frozen=True)
+class _LoadedTrajectory:
+    """A parsed trajectory and everything derived from it (shared, treat as read-only)."""
+
+    raw: dict
+    steps: list[dict] = field(default_factory=list)
+    message_rows: list[dict] = field(default_factory=list)
+    metrics: dict = field(default_factory=dict)
+    step_analytics: list[dict] = field(default_factory=list)
+    phases: list[dict] = field(default_factory=list)
+    insights: list[str] = field(default_factory=list)
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_pipeline(file_path: str, mtime_ns: int, size: int) -> _LoadedTrajectory:
+    """Load, parse, and analyze *file_path*.
+
+    *mtime_ns* and *size* are only part of the cache key, so revisiting an
+    unchanged file skips the JSON parse and all metric passes, while an
+    edited file is reprocessed.
+    """
+    raw = load_trajectory(file_path)
+    if "_error" in raw:
+        return _LoadedTrajectory(raw=raw)
+    steps = parse_steps(raw)
+    message_rows = build_message_metrics(steps)
+    step_analytics = compute_step_analytics(steps)
+    phases = detect_phases(step_analytics)
+    return _LoadedTrajectory(
+        raw=raw,
+        steps=steps,
+        message_rows=message_rows,
+        metrics=compute_metrics(steps, raw, message_rows=message_rows),
+        step_analytics=step_analytics,
+        phases=phases,
+        insights=generate_insights(step_analytics, phases, steps=steps),
+    )
+
+
+_FIGURE_BUILDERS = {
+    "token": lambda t: build_token_chart(t.steps, cumulative=False, phases=t.phases),
+    "token_cumulative": lambda t: build_token_chart(t.steps, cumulative=True, phases=t.phases),
+    "duration": lambda t: build_duration_chart(t.steps, phases=t.phases),
+    "tool": lambda t: build_tool_chart(t.steps),
+    "cache_ratio": lambda t: build_cache_ratio_chart(t.message_rows, phases=t.phases),
+    "efficiency": lambda t: build_efficiency_chart(t.message_rows, phases=t.phases),
+    "context_growth": lambda t: build_context_growth_chart(t.message_rows, phases=t.phases),
+    "tool_duration": lambda t: build_tool_duration_chart(t.steps),
+    "heatmap": lambda t: build_analytics_heatmap(t.step_analytics, t.phases),
+    "phase": lambda t: build_phase_chart(t.phases, t.step_analytics),
+}
+
+
+@functools.lru_cache(maxsize=16 * len(_FIGURE_BUILDERS))
+def _cached_figure(file_key: tuple, name: str) -> go.Figure:
+    """Build chart *name* once for the trajectory identified by *file_key*.
+
+    *file_key* is the ``(path, mtime_ns, size)`` tuple accepted by
+    ``_cached_pipeline``.
+    """
+    return _FIGURE_BUILDERS[name](_cached_pipeline(*file_key))
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_workflow(file_key: tuple) -> tuple[str, str]:
+    """Return the ``(workflow_html, detail_store)`` pair for the Workflow tab."""
+    steps = _cached_pipeline(*file_key).steps
+    return render_workflow_html(steps), _prerender_step_details(steps)
+
+
+# Shared pool for building the independent chart figures of a load concurrently
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="traj-chart")
+
+# Overview (Performance accordion) charts first, then the collapsed accordions
+_LOAD_CHARTS = (
+    "token", "duration", "phase",
+    "context_growth", "heatmap", "cache_ratio",
+    "efficiency", "tool", "tool_duration",
+)
+
+
 def _map_insights_to_sections(insights: list[str]) -> dict[str, list[str]]:
     """Categorize insight strings into Performance / Efficiency / Tools sections."""
     sections: dict[str, list[str]] = {"performance": [], "efficiency": [], "tools": []}
@@ -123,17 +239,27 @@ def _compute_anomalies(metrics: dict, message_rows: list[dict]) -> list[dict]:
     return anomalies[:5]
 
 
+# The Workflow tab's cards are built on first open (a server round trip), so a
+# jump polls for the target card instead of assuming it already exists.
+_CARD_JUMP_POLL_MS = 100
+_CARD_JUMP_MAX_POLLS = 100
+
+
 def _build_card_jump_onclick(idx) -> str:
     """Return a JS onclick string that switches to the Workflow tab,
-    scrolls step card *idx* into view, and clicks it."""
+    waits for step card *idx* to be rendered, scrolls it into view, and
+    clicks it."""
     return (
         f"(function(){{"
         f"var tabs=document.querySelectorAll('.tab-nav button');"
         f"if(tabs.length>1)tabs[1].click();"
-        f"setTimeout(function(){{"
+        f"var n=0;"
+        f"function jump(){{"
         f"var c=document.getElementById('wf-card-{idx}');"
         f"if(c){{c.scrollIntoView({{behavior:'smooth',block:'center'}});c.click();}}"
-        f"}},200);"
+        f"else if(++n<{_CARD_JUMP_MAX_POLLS}){{setTimeout(jump,{_CARD_JUMP_POLL_MS});}}"
+        f"}}"
+        f"setTimeout(jump,200);"
         f"}})()"
     )
 
@@ -175,17 +301,25 @@ def _build_insight_callout_html(insights: list[str], max_items: int = 2) -> str:
     """Render up to *max_items* insight callouts as styled HTML."""
     if not insights:
         return ""
-    items = []
-    for ins in insights[:max_items]:
-        text_html = _linkify_step_refs(html.escape(ins))
-        items.append(
-            f"<div class='insight-callout'>"
-            f"<span class='insight-icon'>&#9432;</span> "
-            f"<span class='insight-text'>{text_html}</span>"
-            f"</div>"
-        )
-    return "".join(items)
-
+    return "".join([
+        f"<div class='insight-callout'>"
+        f"<span class='insight-icon'>&#9432;</span> "
+        f"<span class='insight-text'>{_linkify_step_refs(html.escape(ins))}</span>"
+        f"</div>"
+        for ins in insights[:max_items]
+    ])
+
+
+
+_KPI_CARD_TPL = (
+    "<div class='ov-kpi-card'%s>"
+    "<div class='ov-kpi-label'>%s</div>"
+    "<div class='ov-kpi-value'>%s</div>"
+    "<div class='ov-kpi-sub'>%s</div>"
+    "</div>"
+)
+_KPI_GRID_OPEN = "<div class='ov-kpi-grid'>"
+_KPI_GRID_CLOSE = "</div>"
 
 
 def _build_overview_kpi_html(metrics: dict, wall_fmt: str,
@@ -218,39 +352,44 @@ def _build_overview_kpi_html(metrics: dict, wall_fmt: str,
     }
 
     cards = [
-        ("Steps", f"{metrics.get('total_steps', 0):,}",
-         f"{metrics.get('assistant_steps', 0)} assistant"),
+        ("Steps", f"{metrics['total_steps']:,}",
+         f"{metrics['assistant_steps']} assistant"),
         ("Wall-Clock", wall_fmt,
-         f"P95 {metrics.get('p95_duration', 0)}s"),
-        ("Tokens", f"{metrics.get('tokens', {}).get('total', 0):,}",
-         f"{metrics.get('tokens_per_second', 0):,} tok/s"),
-        ("Tool Success", f"{metrics.get('tool_success_rate', 0)}%",
-         f"{metrics.get('tool_call_count', 0):,} calls"),
-        ("Cache Read %", f"{metrics.get('avg_cache_ratio', 0)}%",
-         f"{metrics.get('cache_dominant_steps', 0)} dominant steps"),
-        ("Fresh Input", f"{metrics.get('non_cache_ratio', 0)}%",
-         f"{metrics.get('non_cache_tokens', 0):,} tokens"),
+         f"P95 {metrics['p95_duration']}s"),
+        ("Tokens", f"{metrics['tokens']['total']:,}",
+         f"{metrics['tokens_per_second']:,} tok/s"),
+        ("Tool Success", f"{metrics['tool_success_rate']}%",
+         f"{metrics['tool_call_count']:,} calls"),
+        ("Cache Read %", f"{metrics['avg_cache_ratio']}%",
+         f"{metrics['cache_dominant_steps']} dominant steps"),
+        ("Fresh Input", f"{metrics['non_cache_ratio']}%",
+         f"{metrics['non_cache_tokens']:,} tokens"),
     ]
+    # Escape every label/value/sub in one pass; cards are fixed 3-tuples
+    escaped = list(map(html.escape, chain.from_iterable(cards)))
     card_html = []
-    for label, value, sub in cards:
+    for i, (label, _, _) in enumerate(cards):
+        attrs = ""
         verdict_info = _verdict_map.get(label)
-        extra_style = ""
-        title_attr = ""
-        data_attr = ""
         if verdict_info:
             status, detail = verdict_info
             border_color = _status_colors.get(status, "#6b7280")
-            extra_style = f" style='border-left:4px solid {border_color};'"
-            title_attr = f" title='{html.escape(detail)}'"
-            data_attr = f" data-status='{html.escape(status)}'"
-        card_html.append(
-            f"<div class='ov-kpi-card'{extra_style}{title_attr}{data_attr}>"
-            f"<div class='ov-kpi-label'>{html.escape(str(label))}</div>"
-            f"<div class='ov-kpi-value'>{html.escape(str(value))}</div>"
-            f"<div class='ov-kpi-sub'>{html.escape(str(sub))}</div>"
-            "</div>"
-        )
-    return "<div class='ov-kpi-grid'>" + "".join(card_html) + "</div>"
+            attrs = (f" style='border-left:4px solid {border_color};'"
+                     f" title='{html.escape(detail)}'"
+                     f" data-status='{html.escape(status)}'")
+        card_html.append(_KPI_CARD_TPL % (attrs, *escaped[3 * i:3 * i + 3]))
+    return _KPI_GRID_OPEN + "".join(card_html) + _KPI_GRID_CLOSE
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_summary_html(file_key: tuple) -> tuple[str, str]:
+    """Return the ``(banner, kpi_html)`` pair for the trajectory at *file_key*."""
+    loaded = _cached_pipeline(*file_key)
+    _, wfmt = wall_clock_fmt(loaded.metrics)
+    banner = format_banner_html(os.path.basename(file_key[0]), loaded.metrics, wfmt)
+    # Verdicts feed the KPI cards' status borders/tooltips
+    verdicts = compute_health_verdict(loaded.metrics, loaded.step_analytics)
+    return banner, _build_overview_kpi_html(loaded.metrics, wfmt, verdicts=verdicts)
 
 
 def build_ui() -> gr.Blocks:
@@ -259,6 +398,14 @@ def build_ui() -> gr.Blocks:
     with gr.Blocks(title="Trajectory Insight Finder") as app:
         # Per-session state via gr.State
         state_steps = gr.State([])
+        # Raw trajectory + "already serialized" flag for the lazily-built Raw Data tab
+        state_raw = gr.State(None)
+        state_raw_rendered = gr.State(False)
+        # "Workflow cards already rendered" flag for the lazily-built Workflow tab
+        state_wf_rendered = gr.State(False)
+        state_active_tab = gr.State("Overview")
+        # (path, mtime_ns, size) of the loaded file, used to look up cached figures
+        state_file_key = gr.State(None)
 
         gr.Markdown("# Trajectory Insight Finder\nLoad a trajectory JSON to inspect agent execution steps, token usage, and tool calls.")
 
@@ -282,7 +429,7 @@ def build_ui() -> gr.Blocks:
         anomaly_strip_html = gr.HTML("")
 
         # -- Tabs --
-        with gr.Tabs():
+        with gr.Tabs() as tabs:
             # ===== Overview Tab (unified — includes former Analytics content) =====
             with gr.TabItem("Overview"):
                 overview_kpi_html = gr.HTML("", elem_classes=["overview-kpi-strip"])
@@ -346,7 +493,7 @@ def build_ui() -> gr.Blocks:
                     per_message_md = gr.Markdown("", elem_classes=["overview-card"])
 
             # ===== Workflow Tab =====
-            with gr.TabItem("Workflow"):
+            with gr.TabItem(_WORKFLOW_TAB):
                 with gr.Row(equal_height=True):
                     wf_filter_checks = gr.CheckboxGroup(
                         choices=["Assistant", "User", "Tool Calls", "Errors", "Reasoning"],
@@ -394,9 +541,12 @@ def build_ui() -> gr.Blocks:
                 detail_store = gr.HTML("", elem_id="wf-detail-store")
 
             # ===== Raw Data Tab =====
-            with gr.TabItem("Raw Data"):
+            with gr.TabItem(_RAW_TAB):
+                raw_download = gr.DownloadButton(
+                    "Download full JSON", visible=False, size="sm",
+                )
                 raw_json = gr.Code(
-                    label="Full trajectory JSON",
+                    label="Trajectory JSON (preview)",
                     language="json",
                     value="",
                     max_lines=50,
@@ -404,12 +554,9 @@ def build_ui() -> gr.Blocks:
 
         # -- Callbacks --
 
-        _empty_fig = go.Figure()
-        _empty_fig.update_layout(template="plotly_white", height=380)
-
         def _empty_result(banner="", detail="*No data*"):
             """Return the empty outputs tuple for error states."""
-            f = _empty_fig
+            f = _EMPTY_FIG
             return (
                 [],              # state_steps
                 banner,          # summary_banner
@@ -436,36 +583,66 @@ def build_ui() -> gr.Blocks:
                 "",              # detail_store
                 _DETAIL_PLACEHOLDER,  # detail_html
                 "",              # raw_json
+                None,            # state_raw
+                False,           # state_raw_rendered
+                None,            # state_file_key
+                gr.update(value=None, visible=False),  # raw_download
+                False,           # state_wf_rendered
             )
 
-        def do_load(upload_obj):
-            """Load trajectory from uploaded file."""
+        def do_load(upload_obj, active_tab, prev_file_key):
+            """Load trajectory from uploaded file, streaming results in stages.
+
+            Yields partial ``{component: value}`` updates so the summary
+            (banner, KPIs, overview tables) renders before the charts and
+            workflow cards have been built.  The workflow cards and raw JSON
+            are only built here if their tab is already open; otherwise they
+            are deferred to the first time that tab is selected.
+            """
             file_path = None
             if upload_obj is not None:
                 file_path = upload_obj if isinstance(upload_obj, str) else upload_obj.name
 
-            if not file_path or not os.path.isfile(file_path):
-                return _empty_result(detail="*No file selected or file not found.*")
-
-            raw = load_trajectory(file_path)
+            # One stat both validates the path and keys the pipeline cache
+            try:
+                st = os.stat(file_path) if file_path else None
+            except OSError:
+                st = None
+            if st is None or not stat.S_ISREG(st.st_mode):
+                yield _empty_result(detail="*No file selected or file not found.*")
+                return
+
+            file_key = (file_path, st.st_mtime_ns, st.st_size)
+            loaded = _cached_pipeline(*file_key)
+            raw = loaded.raw
             if "_error" in raw:
                 err_banner = f"<p style='color:#dc2626;'>Error: {html.escape(raw['_error'])}</p>"
-                return _empty_result(banner=err_banner, detail="*Error loading file.*")
+                yield _empty_result(banner=err_banner, detail="*Error loading file.*")
+                return
 
-            steps = parse_steps(raw)
-            message_rows = build_message_metrics(steps)
-            metrics = compute_metrics(steps, raw, message_rows=message_rows)
+            steps = loaded.steps
+            message_rows = loaded.message_rows
+            metrics = loaded.metrics
             _d = lambda k: raw.get(k, {}) if isinstance(raw.get(k), dict) else {}
             md, timing, outp = _d("metadata"), _d("timing"), _d("output")
             session_raw, retry = _d("session_raw"), _d("retry")
 
+            # -- Analytics (computed before charts so annotations can use phases) --
+            phases = loaded.phases
+
+            # Start all chart builds now so they overlap the summary stage
+            fig_futures = {name: _EXECUTOR.submit(_cached_figure, file_key, name)
+                           for name in _LOAD_CHARTS}
+            # Warm the cache for the toggle's other variant; nothing waits on it
+            _EXECUTOR.submit(_cached_figure, file_key, "token_cumulative")
+
             model_id, provider_id, agent_id = extract_agent_info(steps)
             _, wfmt = wall_clock_fmt(metrics)
-            banner = format_banner_html(os.path.basename(file_path), metrics, wfmt)
-            # Verdicts computed early so KPI cards can show status indicators
-            verdicts = compute_health_verdict(metrics,
-                                              compute_step_analytics(steps) if steps else [])
-            kpi_html = _build_overview_kpi_html(metrics, wfmt, verdicts=verdicts)
+            if file_key == prev_file_key:
+                # Reloading the same file: the browser already shows these
+                banner = kpi_html = gr.skip()
+            else:
+                banner, kpi_html = _cached_summary_html(file_key)
 
             # -- Overview markdown sections --
             meta_text = format_session_md(
@@ -474,83 +651,73 @@ def build_ui() -> gr.Blocks:
             )
             metrics_text = format_performance_md(metrics, wfmt)
             behavior_text = format_behavioral_md(metrics)
-            hotspots_text = _build_hotspots_md(message_rows)
-            per_message_text = _build_per_message_md(message_rows)
             summary_info = session_raw.get("summary", {})
             outp_text = format_output_md(outp, md, summary_info, metrics)
-
-            # -- Workflow tab --
-            wf_html = render_workflow_html(steps)
-            wf_count = f"<div class='wf-count'>Showing {len(steps)} of {len(steps)} steps</div>"
-            detail_store_val = _prerender_step_details(steps)
-
-            # -- Analytics (computed before charts so annotations can use phases) --
-            step_analytics = compute_step_analytics(steps)
-            phases = detect_phases(step_analytics)
-
-            # -- Charts --
-            tok_fig = build_token_chart(steps, cumulative=False, phases=phases)
-            dur_fig = build_duration_chart(steps, phases=phases)
-            tl_fig = build_tool_chart(steps)
-            cache_fig = build_cache_ratio_chart(message_rows, phases=phases)
-            eff_fig = build_efficiency_chart(message_rows, phases=phases)
-            ctx_fig = build_context_growth_chart(message_rows, phases=phases)
-            insights_list = generate_insights(step_analytics, phases, steps=steps)
-            tool_dur_fig = build_tool_duration_chart(steps)
-
-            phase_md = "### Phase Summary\n\n" + "\n\n".join(
+            phase_md = "### Phase Summary\n\n" + "\n\n".join([
                 f"**{p['name']}** (idx {p['start_idx']}\u2013{p['end_idx']}): "
                 f"{p['token_share']}% tokens, {p['runtime_share']}% time"
-                for p in phases)
-            heatmap_fig = build_analytics_heatmap(step_analytics, phases)
-            phase_fig = build_phase_chart(phases, step_analytics)
-
-
-            # -- Section insight callouts --
-            section_insights = _map_insights_to_sections(insights_list)
-            perf_callout = _build_insight_callout_html(section_insights["performance"])
-            eff_callout = _build_insight_callout_html(section_insights["efficiency"])
-            tools_callout = _build_insight_callout_html(section_insights["tools"])
+                for p in phases])
 
             # -- Anomaly strip --
             anomalies = _compute_anomalies(metrics, message_rows)
             anomaly_html = _build_anomaly_strip_html(anomalies)
 
-            # -- Raw data --
-            raw_str = json.dumps(raw, indent=2, ensure_ascii=False, default=str)
-            if len(raw_str) > 500_000:
-                raw_str = raw_str[:500_000] + "\n\n... (truncated at 500KB)"
+            # Stage 1: summary
+            yield {
+                state_steps: steps,
+                state_file_key: file_key,
+                summary_banner: banner,
+                anomaly_strip_html: anomaly_html,
+                overview_kpi_html: kpi_html,
+                meta_md: meta_text,
+                output_md: outp_text,
+                analytics_phase_md: phase_md,
+                metrics_md: metrics_text,
+                behavior_md: behavior_text,
+                detail_html: _DETAIL_PLACEHOLDER,
+            }
+
+            # -- Charts (memoized per file, so revisits skip figure building) --
+            figs = {name: fut.result() for name, fut in fig_futures.items()}
 
-            return (
-                steps,              # state_steps
-                banner,             # summary_banner
-                anomaly_html,       # anomaly_strip_html
-                kpi_html,           # overview_kpi_html
-                meta_text,          # meta_md
-                outp_text,          # output_md
-                phase_md,           # analytics_phase_md
-                metrics_text,       # metrics_md
-                perf_callout,       # perf_insights_html
-                tok_fig,            # token_chart
-                dur_fig,            # duration_chart
-                phase_fig,          # analytics_phase_chart
-                eff_callout,        # eff_insights_html
-                ctx_fig,            # context_growth_chart
-                heatmap_fig,        # analytics_heatmap
-                cache_fig,          # cache_chart
-                behavior_text,      # behavior_md
-                tools_callout,      # tools_insights_html
-                eff_fig,            # efficiency_chart
-                tl_fig,             # tool_chart
-                tool_dur_fig,       # tool_duration_chart
-                hotspots_text,      # hotspots_md
-                per_message_text,   # per_message_md
-                wf_count,           # wf_count_html
-                wf_html,            # workflow_html
-                detail_store_val,   # detail_store
-                _DETAIL_PLACEHOLDER,  # detail_html
-                raw_str,            # raw_json
-            )
+            # -- Section insight callouts --
+            section_insights = _map_insights_to_sections(loaded.insights)
+
+            # Stage 2: charts, insights, and per-step tables
+            yield {
+                perf_insights_html: _build_insight_callout_html(section_insights["performance"]),
+                eff_insights_html: _build_insight_callout_html(section_insights["efficiency"]),
+                tools_insights_html: _build_insight_callout_html(section_insights["tools"]),
+                token_chart: figs["token"],
+                duration_chart: figs["duration"],
+                analytics_phase_chart: figs["phase"],
+                context_growth_chart: figs["context_growth"],
+                analytics_heatmap: figs["heatmap"],
+                cache_chart: figs["cache_ratio"],
+                efficiency_chart: figs["efficiency"],
+                tool_chart: figs["tool"],
+                tool_duration_chart: figs["tool_duration"],
+                hotspots_md: _build_hotspots_md(message_rows),
+                per_message_md: _build_per_message_md(message_rows, top_k=50),
+            }
+
+            # -- Workflow cards and raw data (lazy unless their tab is being viewed) --
+            wf_now = active_tab == _WORKFLOW_TAB
+            wf_html, detail_store_val = _cached_workflow(file_key) if wf_now else ("", "")
+            wf_count = f"<div class='wf-count'>Showing {len(steps)} of {len(steps)} steps</div>"
+            raw_now = active_tab == _RAW_TAB
+
+            # Stage 3: workflow cards and raw JSON
+            yield {
+                wf_count_html: wf_count,
+                workflow_html: wf_html,
+                detail_store: detail_store_val,
+                state_wf_rendered: wf_now,
+                raw_json: _serialize_raw(raw) if raw_now else "",
+                raw_download: gr.update(value=file_path, visible=True),
+                state_raw: raw,
+                state_raw_rendered: raw_now,
+            }
 
         all_outputs = [
             state_steps,              # 0
@@ -581,25 +748,57 @@ def build_ui() -> gr.Blocks:
             detail_store,             # 27
             detail_html,              # 29
             raw_json,                 # 30
+            state_raw,                # 31
+            state_raw_rendered,       # 32
+            state_file_key,           # 33
+            raw_download,             # 34
+            state_wf_rendered,        # 35
         ]
 
         load_btn.click(
             fn=do_load,
-            inputs=[file_upload],
+            inputs=[file_upload, state_active_tab, state_file_key],
             outputs=all_outputs,
         )
 
-        # -- Chart toggle callback --
-        def on_chart_toggle(mode, steps):
-            sa = compute_step_analytics(steps or [])
-            ph = detect_phases(sa) if sa else []
-            return build_token_chart(steps or [], cumulative=(mode == "Cumulative"),
-                                     phases=ph)
+        # -- Lazy tab callback --
+        def on_tab_select(raw, raw_rendered, file_key, wf_rendered, evt: gr.SelectData):
+            """Record the active tab and build its content on first open."""
+            tab = evt.value
+            updates = {state_active_tab: tab}
+            if tab == _RAW_TAB and not raw_rendered and raw is not None:
+                updates.update({raw_json: _serialize_raw(raw), state_raw_rendered: True})
+            elif tab == _WORKFLOW_TAB and not wf_rendered and file_key is not None:
+                wf_html, detail_store_val = _cached_workflow(file_key)
+                updates.update({
+                    workflow_html: wf_html,
+                    detail_store: detail_store_val,
+                    state_wf_rendered: True,
+                })
+            return updates
+
+        tabs.select(
+            fn=on_tab_select,
+            inputs=[state_raw, state_raw_rendered, state_file_key, state_wf_rendered],
+            outputs=[state_active_tab, raw_json, state_raw_rendered,
+                     workflow_html, detail_store, state_wf_rendered],
+        )
 
+        # -- Chart toggle callback --
+        def on_chart_toggle(mode, file_key):
+            if file_key is None:
+                return _EMPTY_FIG
+            return _cached_figure(file_key,
+                                  "token_cumulative" if mode == "Cumulative" else "token")
+
+        # "always_last" drops queued toggles during a burst of clicks so only
+        # the final selection rebuilds the chart.
         chart_toggle.change(
             fn=on_chart_toggle,
-            inputs=[chart_toggle, state_steps],
+            inputs=[chart_toggle, state_file_key],
             outputs=[token_chart],
+            trigger_mode="always_last",
+            show_progress="hidden",
         )
 
         # -- Workflow filter callback --
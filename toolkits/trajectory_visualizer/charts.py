@@ -1,67 +1,148 @@
 """Plotly chart builders for trajectory visualization."""
 
-import statistics
+import functools
+from collections import Counter, defaultdict
+from operator import itemgetter
 
+import numpy as np
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import plotly.io as pio
+from plotly.colors import get_colorscale
 
-from .data import infer_non_cache_input
+from ._resample import RESAMPLE_TARGET, RESAMPLE_THRESHOLD, lttb
+from .data import infer_non_cache_input_array
+
+
+_ROLE_BAR_COLORS = {"user": "#1e40af", "assistant": "#92400e"}
+_FINISHED = ("stop", "end_turn")
 
 
 def _plotly_step_color(step: dict) -> str:
     """Return a hex bar-color for a step (Plotly can't use CSS variables)."""
     if step["error_count"] > 0:
         return "#dc2626"
-    if step.get("finish") in ("stop", "end_turn"):
+    if step.get("finish") in _FINISHED:
         return "#059669"
     if step["tool_call_count"] > 0:
         return "#d97706"
-    if step["has_reasoning"] and step["role"] == "assistant":
+    role = step["role"]
+    if step["has_reasoning"] and role == "assistant":
         return "#7c3aed"
-    return {"user": "#1e40af", "assistant": "#92400e"}.get(step["role"], "#6b7280")
+    return _ROLE_BAR_COLORS.get(role, "#6b7280")
 
 
 # -- Layout helpers -------------------------------------------------------
+#
+# Figures are assembled from plain trace/layout dicts and wrapped without
+# graph_objects' per-property validation.  Anything the validators would
+# normally resolve from a name (template, colorscale) is resolved once here.
 
 _TPL = "plotly_white"
+_TEMPLATE = pio.templates[_TPL]
+_HEATMAP_COLORSCALE = [list(c) for c in get_colorscale("YlOrRd")]
+
+# Layout fragments shared by every figure.  _figure() copies the layout,
+# so these are never mutated through a returned figure.
+_BASE_MARGIN = {"t": 50, "b": 40, "l": 60, "r": 20}
+_H_LEGEND = {"orientation": "h", "yanchor": "bottom", "y": 1.06, "xanchor": "center", "x": 0.5}
+_H_LEGEND_TIGHT = {**_H_LEGEND, "y": 1.02}
+
+
+def _figure(data: list[dict], layout: dict) -> go.Figure:
+    """Wrap plain trace and layout dicts in a Figure, skipping validation."""
+    return go.Figure(data=data, layout=layout, _validate=False)
 
 
 def _empty_figure(height: int = 380, message: str | None = None) -> go.Figure:
     """Return a blank Plotly figure, optionally with a centered message."""
-    fig = go.Figure()
+    layout = {"template": _TEMPLATE, "height": height}
     if message:
-        fig.add_annotation(text=message, xref="paper", yref="paper",
-                           x=0.5, y=0.5, showarrow=False, font_size=16)
-    fig.update_layout(template=_TPL, height=height)
-    return fig
-
-
-def _apply_chart_layout(fig: go.Figure, title: str,
-                         xaxis: str | None = None, yaxis: str | None = None,
-                         height: int = 380, **kwargs) -> None:
-    """Apply standard chart layout (template + margins)."""
-    layout = dict(
-        title=title,
-        template=_TPL,
-        height=height,
-        margin=dict(t=50, b=40, l=60, r=20),
-    )
+        layout["annotations"] = [{
+            "text": message, "xref": "paper", "yref": "paper",
+            "x": 0.5, "y": 0.5, "showarrow": False, "font": {"size": 16},
+        }]
+    return _figure([], layout)
+
+
+def _chart_layout(title: str, xaxis: str | None = None, yaxis: str | None = None,
+                  height: int = 380, **kwargs) -> dict:
+    """Return the standard chart layout dict (template + margins)."""
+    layout = {
+        "title": {"text": title},
+        "template": _TEMPLATE,
+        "height": height,
+        "margin": _BASE_MARGIN,
+    }
     if xaxis:
-        layout["xaxis_title"] = xaxis
+        layout["xaxis"] = {"title": {"text": xaxis}}
     if yaxis:
-        layout["yaxis_title"] = yaxis
+        layout["yaxis"] = {"title": {"text": yaxis}}
     layout.update(kwargs)
-    fig.update_layout(**layout)
+    return layout
 
 
-def _add_legend_hint(fig: go.Figure) -> None:
+def _add_legend_hint(layout: dict) -> None:
     """Add a subtle 'click legend to toggle' hint at the bottom-right."""
-    fig.add_annotation(
-        text="Click legend items to show/hide series",
-        xref="paper", yref="paper", x=1.0, y=-0.12,
-        showarrow=False, font=dict(size=9, color="#9ca3af"),
-        xanchor="right",
-    )
+    layout.setdefault("annotations", []).append({
+        "text": "Click legend items to show/hide series",
+        "xref": "paper", "yref": "paper", "x": 1.0, "y": -0.12,
+        "showarrow": False, "font": {"size": 9, "color": "#9ca3af"},
+        "xanchor": "right",
+    })
+
+
+def _add_avg_line(layout: dict, y: float, text: str) -> None:
+    """Add a dashed red horizontal average line labelled at the right edge."""
+    layout.setdefault("shapes", []).append({
+        "type": "line", "xref": "x domain", "x0": 0, "x1": 1,
+        "yref": "y", "y0": y, "y1": y,
+        "line": {"color": "#dc2626", "dash": "dash"},
+    })
+    layout.setdefault("annotations", []).append({
+        "text": text, "showarrow": False,
+        "xref": "x domain", "x": 1, "xanchor": "right",
+        "yref": "y", "y": y, "yanchor": "bottom",
+    })
+
+
+# The heavier builders memoize their (data, layout) payload on a hashable
+# snapshot of exactly the inputs they read, so re-rendering unchanged data
+# skips the work.  _figure() copies the dicts, so callers never alias the
+# cached payload.
+_PAYLOAD_CACHE_SIZE = 64
+
+
+def _phase_key(phases: list[dict] | None) -> tuple:
+    """Return the hashable part of *phases* that the overlays depend on."""
+    return tuple((p["name"], p["start_idx"], p["end_idx"]) for p in phases or ())
+
+
+def _phases_from_key(key: tuple) -> list[dict]:
+    """Inverse of _phase_key()."""
+    return [{"name": n, "start_idx": s, "end_idx": e} for n, s, e in key]
+
+
+def _resample_indices(values: list[float], max_points: int | None,
+                      **kwargs) -> list[int] | None:
+    """Return the LTTB indices to plot for a long series, or None to keep all.
+
+    Series up to RESAMPLE_THRESHOLD points, or any series when *max_points*
+    is falsy, are left alone.  *kwargs* are passed through to lttb().
+    """
+    if not max_points or len(values) <= RESAMPLE_THRESHOLD:
+        return None
+    return lttb(values, n_out=max_points, **kwargs)
+
+
+def _truncate_labels(names: list[str], width: int = 30) -> tuple[list[str], int]:
+    """Return *names* cut to *width* chars for display, and the longest label length."""
+    labels = [n if len(n) <= width else n[:width - 3] + "..." for n in names]
+    return labels, min(width, max(map(len, names)))
+
+
+def _take(seq: list, sel: list[int]) -> list:
+    """Return the elements of *seq* at the (sorted) indices *sel*."""
+    return [seq[i] for i in sel]
 
 
 # -- Annotation utilities ------------------------------------------------
@@ -82,191 +163,227 @@ def _detect_outliers(values: list[float], threshold: float = 2.0) -> list[tuple[
     clean = [v for v in values if v is not None and v > 0]
     if len(clean) < 5:
         return []
-    mean = statistics.mean(clean)
-    stdev = statistics.stdev(clean) if len(clean) > 1 else 0
+    arr = np.array(clean, dtype=float)
+    mean = float(arr.mean())
+    stdev = float(arr.std(ddof=1))
     if stdev == 0:
         return []
-    outliers = []
-    for i, v in enumerate(values):
-        if v is not None and v > 0 and (v - mean) > threshold * stdev:
-            outliers.append((i, v, "spike"))
-    return outliers
+    limit = threshold * stdev
+    return [(i, v, "spike") for i, v in enumerate(values)
+            if v is not None and v > 0 and (v - mean) > limit]
 
 
-def add_phase_overlays(fig: go.Figure, phases: list[dict] | None,
+def add_phase_overlays(layout: dict, phases: list[dict] | None,
                        step_count: int) -> None:
     """Draw semi-transparent vertical regions for each detected phase."""
     if not phases or len(phases) <= 1:
         return
+    shapes = layout.setdefault("shapes", [])
+    annotations = layout.setdefault("annotations", [])
     for p in phases:
         color = _PHASE_COLORS.get(p["name"], "rgba(107,114,128,0.06)")
         label_color = _PHASE_LINE_COLORS.get(p["name"], "#6b7280")
-        fig.add_vrect(
-            x0=p["start_idx"] - 0.5, x1=p["end_idx"] + 0.5,
-            fillcolor=color, layer="below", line_width=0,
-        )
-        fig.add_annotation(
-            x=(p["start_idx"] + p["end_idx"]) / 2, y=1.0,
-            yref="paper", text=p["name"],
-            showarrow=False, font=dict(size=10, color=label_color),
-            yanchor="bottom",
-        )
-
-
-def _add_outlier_annotations(fig: go.Figure, outliers: list[tuple[int, float, str]],
+        shapes.append({
+            "type": "rect", "xref": "x", "x0": p["start_idx"] - 0.5, "x1": p["end_idx"] + 0.5,
+            "yref": "y domain", "y0": 0, "y1": 1,
+            "fillcolor": color, "layer": "below", "line": {"width": 0},
+        })
+        annotations.append({
+            "x": (p["start_idx"] + p["end_idx"]) / 2, "y": 1.0,
+            "yref": "paper", "text": p["name"],
+            "showarrow": False, "font": {"size": 10, "color": label_color},
+            "yanchor": "bottom",
+        })
+
+
+def _add_outlier_annotations(layout: dict, outliers: list[tuple[int, float, str]],
                              fmt: str = ",.0f", suffix: str = "") -> None:
     """Add annotation arrows for detected outlier points."""
+    if not outliers:
+        return
+    annotations = layout.setdefault("annotations", [])
     for idx, val, label in outliers[:5]:  # cap at 5 to avoid clutter
-        fig.add_annotation(
-            x=idx, y=val,
-            text=f"{label}: {val:{fmt}}{suffix}",
-            showarrow=True, arrowhead=2, arrowsize=1, arrowwidth=1,
-            arrowcolor="#dc2626", font=dict(size=9, color="#dc2626"),
-            ax=0, ay=-30,
-        )
+        annotations.append({
+            "x": idx, "y": val,
+            "text": f"{label}: {val:{fmt}}{suffix}",
+            "showarrow": True, "arrowhead": 2, "arrowsize": 1, "arrowwidth": 1,
+            "arrowcolor": "#dc2626", "font": {"size": 9, "color": "#dc2626"},
+            "ax": 0, "ay": -30,
+        })
 
 
 # -- Chart builders -------------------------------------------------------
 
 def build_token_chart(steps: list[dict], cumulative: bool = False,
-                      phases: list[dict] | None = None) -> go.Figure:
+                      phases: list[dict] | None = None,
+                      max_points: int | None = RESAMPLE_TARGET) -> go.Figure:
     """Stacked bar of token breakdown over steps (non-overlapping segments).
 
     Segments: fresh_input + cache_read
               + net_output (output - reasoning) + reasoning = total
+
+    Runs longer than RESAMPLE_THRESHOLD steps are reduced to *max_points*
+    bars; pass ``max_points=None`` to plot every step.
     """
     if not steps:
         return _empty_figure(380)
 
-    indices = list(range(len(steps)))
-    cache_r = [s["tokens"]["cache_read"] for s in steps]
-    fresh_input = [
-        infer_non_cache_input(
-            total_tokens=s["tokens"]["total"],
-            input_tokens=s["tokens"]["input"],
-            output_tokens=s["tokens"]["output"],
-            reasoning_tokens=s["tokens"]["reasoning"],
-            cache_read_tokens=s["tokens"]["cache_read"],
-        )
-        for s in steps
-    ]
-    reasoning_t = [s["tokens"]["reasoning"] for s in steps]
-    net_output = [max(0, s["tokens"]["output"] - s["tokens"]["reasoning"]) for s in steps]
+    tokens = tuple(
+        (t["total"], t["input"], t["output"], t["reasoning"], t["cache_read"])
+        for t in (s["tokens"] for s in steps)
+    )
+    return _figure(*_token_chart_payload(tokens, cumulative, _phase_key(phases),
+                                         max_points))
+
+
+@functools.lru_cache(maxsize=_PAYLOAD_CACHE_SIZE)
+def _token_chart_payload(tokens: tuple, cumulative: bool, phase_key: tuple,
+                         max_points: int | None) -> tuple[list[dict], dict]:
+    """Build the token chart from (total, input, output, reasoning, cache_read) rows."""
+    n = len(tokens)
+    indices = list(range(n))
+    total, inp, out, reasoning, cache = np.array(tokens).T
+    series = np.stack((
+        infer_non_cache_input_array(total, inp, out, reasoning, cache),
+        cache,
+        np.maximum(out - reasoning, 0),
+        reasoning,
+    ))
 
     if cumulative:
-        for lst in (fresh_input, cache_r, net_output, reasoning_t):
-            for i in range(1, len(lst)):
-                lst[i] += lst[i - 1]
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=indices, y=fresh_input, name="Fresh Input",
-                         marker_color="#3b82f6"))
-    fig.add_trace(go.Bar(x=indices, y=cache_r, name="Cache Read",
-                         marker_color="#6ee7b7"))
-    fig.add_trace(go.Bar(x=indices, y=net_output, name="Output",
-                         marker_color="#f59e0b"))
-    fig.add_trace(go.Bar(x=indices, y=reasoning_t, name="Reasoning",
-                         marker_color="#8b5cf6"))
-
-    _apply_chart_layout(
-        fig, "Token Usage by Step" + (" (Cumulative)" if cumulative else ""),
+        series = series.cumsum(axis=1)
+        outliers = []
+    else:
+        outliers = _detect_outliers(total.tolist())
+    fresh_input, cache_r, net_output, reasoning_t = series.tolist()
+
+    stacked = [a + b + c + d for a, b, c, d in
+               zip(fresh_input, cache_r, net_output, reasoning_t)]
+    sel = _resample_indices(stacked, max_points, keep=[o[0] for o in outliers])
+    if sel is not None:
+        indices = sel
+        fresh_input, cache_r, net_output, reasoning_t = (
+            _take(lst, indices)
+            for lst in (fresh_input, cache_r, net_output, reasoning_t))
+
+    data = [
+        {"type": "bar", "x": indices, "y": fresh_input, "name": "Fresh Input",
+         "marker": {"color": "#3b82f6"}},
+        {"type": "bar", "x": indices, "y": cache_r, "name": "Cache Read",
+         "marker": {"color": "#6ee7b7"}},
+        {"type": "bar", "x": indices, "y": net_output, "name": "Output",
+         "marker": {"color": "#f59e0b"}},
+        {"type": "bar", "x": indices, "y": reasoning_t, "name": "Reasoning",
+         "marker": {"color": "#8b5cf6"}},
+    ]
+    layout = _chart_layout(
+        "Token Usage by Step" + (" (Cumulative)" if cumulative else ""),
         xaxis="Step", yaxis="Tokens (count)", height=380,
         barmode="stack",
-        legend=dict(orientation="h", yanchor="bottom", y=1.06, xanchor="center", x=0.5),
+        legend=_H_LEGEND,
     )
-    _add_legend_hint(fig)
-    if not cumulative:
-        totals = [s["tokens"]["total"] for s in steps]
-        outliers = _detect_outliers(totals)
-        _add_outlier_annotations(fig, outliers, fmt=",.0f", suffix=" tok")
-    add_phase_overlays(fig, phases, len(steps))
-    return fig
+    _add_legend_hint(layout)
+    _add_outlier_annotations(layout, outliers, fmt=",.0f", suffix=" tok")
+    add_phase_overlays(layout, _phases_from_key(phase_key), n)
+    return data, layout
 
 
 def build_duration_chart(steps: list[dict],
-                         phases: list[dict] | None = None) -> go.Figure:
-    """Bar chart of step durations with average line."""
+                         phases: list[dict] | None = None,
+                         max_points: int | None = RESAMPLE_TARGET) -> go.Figure:
+    """Bar chart of step durations with average line.
+
+    Long runs are reduced to *max_points* bars as in build_token_chart().
+    """
     if not steps:
         return _empty_figure(380)
 
     indices = list(range(len(steps)))
-    durations = [s["duration"] if s["duration"] is not None else 0 for s in steps]
+    durations = [0 if (d := s["duration"]) is None else d for s in steps]
     colors = [_plotly_step_color(s) for s in steps]
 
     avg_d = sum(durations) / len(durations) if durations else 0
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=indices, y=durations, name="Duration", marker_color=colors,
-                         showlegend=False))
-    fig.add_hline(y=avg_d, line_dash="dash", line_color="#dc2626",
-                  annotation_text=f"Avg: {avg_d:.1f}s")
-    _apply_chart_layout(fig, "Step Duration", xaxis="Step", yaxis="Duration (s)",
-                         height=380)
     outliers = _detect_outliers(durations)
-    _add_outlier_annotations(fig, outliers, fmt=".1f", suffix="s")
-    add_phase_overlays(fig, phases, len(steps))
-    return fig
+
+    bar_x, bar_y = indices, durations
+    sel = _resample_indices(durations, max_points, keep=[o[0] for o in outliers])
+    if sel is not None:
+        bar_x = sel
+        bar_y, colors = _take(durations, bar_x), _take(colors, bar_x)
+
+    data = [{"type": "bar", "x": bar_x, "y": bar_y, "name": "Duration",
+             "marker": {"color": colors}, "showlegend": False}]
+    layout = {}
+    _add_avg_line(layout, avg_d, f"Avg: {avg_d:.1f}s")
+    layout.update(_chart_layout("Step Duration", xaxis="Step", yaxis="Duration (s)",
+                                height=380))
+    _add_outlier_annotations(layout, outliers, fmt=".1f", suffix="s")
+    add_phase_overlays(layout, phases, len(steps))
+    return _figure(data, layout)
 
 
 def build_tool_chart(steps: list[dict]) -> go.Figure:
     """Horizontal bar chart of tool call frequency by name."""
-    breakdown: dict[str, int] = {}
-    for s in steps:
-        for tc in s["tool_calls"]:
-            name = tc.get("tool_name") or "(unnamed)"
-            breakdown[name] = breakdown.get(name, 0) + 1
+    breakdown = Counter(tc.get("tool_name") or "(unnamed)"
+                        for s in steps for tc in s["tool_calls"])
 
     if not breakdown:
         return _empty_figure(300, "No tool calls recorded in this trajectory.")
 
-    sorted_items = sorted(breakdown.items(), key=lambda x: x[1])
-    names = [x[0] for x in sorted_items]
-    counts = [x[1] for x in sorted_items]
+    names, counts = map(list, zip(*sorted(breakdown.items(), key=itemgetter(1))))
     # Truncate long tool names for display; show full name on hover
-    display_names = [n if len(n) <= 30 else n[:27] + "..." for n in names]
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        y=display_names, x=counts, orientation="h", marker_color="#6366f1",
-        text=[str(c) for c in counts], textposition="outside",
-        cliponaxis=False,
-        customdata=names,
-        hovertemplate="%{customdata}: %{x} call(s)<extra></extra>",
-    ))
-    max_label = max(len(n) for n in display_names)
-    _apply_chart_layout(
-        fig, "Tool Call Frequency", xaxis="Count",
+    display_names, max_label = _truncate_labels(names)
+
+    data = [{
+        "type": "bar",
+        "y": display_names, "x": counts, "orientation": "h",
+        "marker": {"color": "#6366f1"},
+        "text": [str(c) for c in counts], "textposition": "outside",
+        "cliponaxis": False,
+        "customdata": names,
+        "hovertemplate": "%{customdata}: %{x} call(s)<extra></extra>",
+    }]
+    layout = _chart_layout(
+        "Tool Call Frequency", xaxis="Count",
         height=max(250, 50 * len(names)),
         margin=dict(l=max(140, max_label * 7 + 20), r=60, t=50, b=40),
     )
-    return fig
+    return _figure(data, layout)
 
 
 def build_cache_ratio_chart(rows: list[dict],
-                            phases: list[dict] | None = None) -> go.Figure:
-    """Bar chart of cache-read ratio (%) per step."""
+                            phases: list[dict] | None = None,
+                            max_points: int | None = RESAMPLE_TARGET) -> go.Figure:
+    """Bar chart of cache-read ratio (%) per step.
+
+    Long runs are reduced to *max_points* bars as in build_token_chart().
+    """
     if not rows:
         return _empty_figure(320)
 
     indices = [r["index"] for r in rows]
     ratios = [r["cache_ratio"] * 100 for r in rows]
     colors = ["#92400e" if r["role"] == "assistant" else "#1e40af" for r in rows]
-    avg_ratio = statistics.mean(ratios) if ratios else 0
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=indices,
-        y=ratios,
-        marker_color=colors,
-        name="Cache Read %",
-        hovertemplate="Step %{x}<br>Cache Read: %{y:.1f}%<extra></extra>",
-    ))
-    fig.add_hline(y=avg_ratio, line_dash="dash", line_color="#dc2626",
-                  annotation_text=f"Avg: {avg_ratio:.1f}%")
-    _apply_chart_layout(fig, "Cache-Read Ratio by Step", xaxis="Step",
-                         yaxis="Cache Read (%)", height=320)
-    add_phase_overlays(fig, phases, len(rows))
-    return fig
+    avg_ratio = sum(ratios) / len(ratios)
+
+    sel = _resample_indices(ratios, max_points)
+    if sel is not None:
+        indices, ratios, colors = (_take(lst, sel) for lst in (indices, ratios, colors))
+
+    data = [{
+        "type": "bar",
+        "x": indices,
+        "y": ratios,
+        "marker": {"color": colors},
+        "name": "Cache Read %",
+        "hovertemplate": "Step %{x}<br>Cache Read: %{y:.1f}%<extra></extra>",
+    }]
+    layout = {}
+    _add_avg_line(layout, avg_ratio, f"Avg: {avg_ratio:.1f}%")
+    layout.update(_chart_layout("Cache-Read Ratio by Step", xaxis="Step",
+                                yaxis="Cache Read (%)", height=320))
+    add_phase_overlays(layout, phases, len(rows))
+    return _figure(data, layout)
 
 
 def build_efficiency_chart(rows: list[dict],
@@ -280,54 +397,79 @@ def build_efficiency_chart(rows: list[dict],
     noncache_s = [r["non_cache_per_sec"] for r in rows]
     tool_wait_pct = [r["tool_time_share"] * 100 for r in rows]
 
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(
-        go.Scatter(
-            x=indices,
-            y=tok_s,
-            mode="lines+markers",
-            name="Tokens/s",
-            line=dict(color="#2563eb", width=2),
-            marker=dict(size=6),
-            hovertemplate="Step %{x}<br>Tokens/s: %{y:.1f}<extra></extra>",
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=indices,
-            y=noncache_s,
-            mode="lines+markers",
-            name="Fresh Input tok/s",
-            line=dict(color="#059669", width=2, dash="dot"),
-            marker=dict(size=5),
-            hovertemplate="Step %{x}<br>Fresh Input tok/s: %{y:.1f}<extra></extra>",
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Bar(
-            x=indices,
-            y=tool_wait_pct,
-            name="Tool-wait %",
-            marker_color="#f59e0b",
-            opacity=0.28,
-            hovertemplate="Step %{x}<br>Tool-wait: %{y:.2f}%<extra></extra>",
-        ),
-        secondary_y=True,
-    )
-    _apply_chart_layout(
-        fig,
+    data = [
+        {
+            "type": "scatter",
+            "x": indices,
+            "y": tok_s,
+            "mode": "lines+markers",
+            "name": "Tokens/s",
+            "line": {"color": "#2563eb", "width": 2},
+            "marker": {"size": 6},
+            "hovertemplate": "Step %{x}<br>Tokens/s: %{y:.1f}<extra></extra>",
+            "xaxis": "x", "yaxis": "y",
+        },
+        {
+            "type": "scatter",
+            "x": indices,
+            "y": noncache_s,
+            "mode": "lines+markers",
+            "name": "Fresh Input tok/s",
+            "line": {"color": "#059669", "width": 2, "dash": "dot"},
+            "marker": {"size": 5},
+            "hovertemplate": "Step %{x}<br>Fresh Input tok/s: %{y:.1f}<extra></extra>",
+            "xaxis": "x", "yaxis": "y",
+        },
+        {
+            "type": "bar",
+            "x": indices,
+            "y": tool_wait_pct,
+            "name": "Tool-wait %",
+            "marker": {"color": "#f59e0b"},
+            "opacity": 0.28,
+            "hovertemplate": "Step %{x}<br>Tool-wait: %{y:.2f}%<extra></extra>",
+            "xaxis": "x", "yaxis": "y2",
+        },
+    ]
+    # Single-cell subplot grid with a secondary y-axis (as make_subplots lays it out)
+    layout = {
+        "xaxis": {"anchor": "y", "domain": [0.0, 0.94], "title": {"text": "Step"}},
+        "yaxis": {"anchor": "x", "domain": [0.0, 1.0],
+                  "title": {"text": "Throughput (tok/s)"}},
+        "yaxis2": {"anchor": "x", "overlaying": "y", "side": "right",
+                   "title": {"text": "Tool Wait (%)"}},
+    }
+    layout.update(_chart_layout(
         "Per-Step Efficiency — Left axis: tok/s · Right axis: Tool Wait %",
         height=340, margin=dict(t=65, b=40, l=60, r=60),
-        legend=dict(orientation="h", yanchor="bottom", y=1.06, xanchor="center", x=0.5),
-    )
-    _add_legend_hint(fig)
-    fig.update_xaxes(title_text="Step")
-    fig.update_yaxes(title_text="Throughput (tok/s)", secondary_y=False)
-    fig.update_yaxes(title_text="Tool Wait (%)", secondary_y=True)
-    add_phase_overlays(fig, phases, len(rows))
-    return fig
+        legend=_H_LEGEND,
+    ))
+    _add_legend_hint(layout)
+    add_phase_overlays(layout, phases, len(rows))
+    return _figure(data, layout)
+
+
+_HEATMAP_METRIC_KEYS = (
+    "cache_ratio", "tool_time_share", "tok_per_s", "out_in_ratio",
+    "non_cache_tok", "idle_before_s",
+)
+_HEATMAP_LABELS = (
+    "Cache Read %", "Tool Time Share", "Tok/s", "Out/In Ratio",
+    "Fresh Input Tokens", "Idle Gap (s)",
+)
+_HEATMAP_LEVELS = 255
+_HEATMAP_COLORBAR = {
+    "tickvals": [_HEATMAP_LEVELS * i / 4 for i in range(5)],
+    "ticktext": ["0", "0.25", "0.5", "0.75", "1"],
+}
+_HEATMAP_HOVER_FMT = {
+    "cache_ratio": lambda v: f"{v * 100:.1f}%",
+    "tool_time_share": lambda v: f"{v * 100:.1f}%",
+    "tok_per_s": lambda v: f"{v:,.0f}",
+    "out_in_ratio": lambda v: f"{v:.3f}",
+    "non_cache_tok": lambda v: f"{v:,.0f}",
+    "idle_before_s": lambda v: f"{v:.2f}s",
+}
 
 
 def build_analytics_heatmap(
@@ -337,67 +479,64 @@ def build_analytics_heatmap(
     if not analytics:
         return _empty_figure(300)
 
-    metric_keys = [
-        "cache_ratio", "tool_time_share", "tok_per_s", "out_in_ratio",
-        "non_cache_tok", "idle_before_s",
-    ]
-    labels = [
-        "Cache Read %", "Tool Time Share", "Tok/s", "Out/In Ratio",
-        "Fresh Input Tokens", "Idle Gap (s)",
-    ]
-
-    z: list[list[float]] = []
-    hover: list[list[str]] = []
-    for mk, lab in zip(metric_keys, labels):
-        row_raw = [a.get(mk) or 0 for a in analytics]
-        max_v = max(row_raw) if row_raw else 1
-        if max_v == 0:
-            max_v = 1
-        z.append([v / max_v for v in row_raw])
-
-        row_h: list[str] = []
-        for a in analytics:
-            v = a.get(mk)
-            if v is None:
-                row_h.append(f"Step {a['index']} ({a['role']})<br>{lab}: N/A")
-            elif mk in ("cache_ratio", "tool_time_share"):
-                row_h.append(
-                    f"Step {a['index']} ({a['role']})<br>{lab}: {v * 100:.1f}%")
-            elif mk in ("tok_per_s", "non_cache_tok"):
-                row_h.append(
-                    f"Step {a['index']} ({a['role']})<br>{lab}: {v:,.0f}")
-            elif mk == "idle_before_s":
-                row_h.append(
-                    f"Step {a['index']} ({a['role']})<br>{lab}: {v:.2f}s")
-            else:
-                row_h.append(
-                    f"Step {a['index']} ({a['role']})<br>{lab}: {v:.3f}")
-        hover.append(row_h)
-
-    fig = go.Figure(data=go.Heatmap(
-        z=z,
-        x=[str(a["index"]) for a in analytics],
-        y=labels,
-        hovertext=hover,
-        hoverinfo="text",
-        colorscale="YlOrRd",
-        showscale=True,
-    ))
-
-    if phases:
-        for phase in phases:
-            if phase["start_idx"] > 0:
-                fig.add_vline(
-                    x=phase["start_idx"] - 0.5,
-                    line_dash="dash", line_color="#3b82f6", line_width=2,
-                    annotation_text=phase["name"],
-                    annotation_position="top",
-                )
-
-    _apply_chart_layout(fig, "Behavioral Heatmap (normalized per metric)",
-                         xaxis="Step", height=360,
-                         margin=dict(t=50, b=40, l=120, r=20))
-    return fig
+    labelled = tuple((a["index"], a["role"]) for a in analytics)
+    values = tuple(tuple(a.get(mk) for a in analytics) for mk in _HEATMAP_METRIC_KEYS)
+    return _figure(*_heatmap_payload(labelled, values, _phase_key(phases)))
+
+
+@functools.lru_cache(maxsize=_PAYLOAD_CACHE_SIZE)
+def _heatmap_payload(labelled: tuple, values: tuple,
+                     phase_key: tuple) -> tuple[list[dict], dict]:
+    """Build the heatmap from (index, role) pairs and one value row per metric."""
+    raw = np.array([[v or 0 for v in row] for row in values], dtype=float)
+    row_max = raw.max(axis=1, keepdims=True)
+    row_max[row_max == 0] = 1
+    # The colorscale only resolves ~256 shades, so send 0-255 ints instead
+    # of full-precision floats; the colorbar is relabelled back to 0-1.
+    z = np.clip(np.rint(raw / row_max * _HEATMAP_LEVELS), 0, _HEATMAP_LEVELS)
+    z = z.astype(np.uint8).tolist()
+
+    # Hover text is assembled client-side from the template; only the
+    # per-cell value (formatted per metric) and the step's role are sent.
+    roles = [role for _, role in labelled]
+    shown: list[list[str]] = []
+    for mk, row in zip(_HEATMAP_METRIC_KEYS, values):
+        fmt = _HEATMAP_HOVER_FMT[mk]
+        shown.append(["N/A" if v is None else fmt(v) for v in row])
+
+    data = [{
+        "type": "heatmap",
+        "z": z,
+        "x": [str(idx) for idx, _ in labelled],
+        "y": list(_HEATMAP_LABELS),
+        "text": shown,
+        "customdata": [roles] * len(_HEATMAP_METRIC_KEYS),
+        "hovertemplate": "Step %{x} (%{customdata})<br>%{y}: %{text}<extra></extra>",
+        "colorscale": _HEATMAP_COLORSCALE,
+        "zmin": 0, "zmax": _HEATMAP_LEVELS,
+        "colorbar": _HEATMAP_COLORBAR,
+        "showscale": True,
+    }]
+
+    layout: dict = {}
+    for phase in _phases_from_key(phase_key):
+        if phase["start_idx"] > 0:
+            x = phase["start_idx"] - 0.5
+            layout.setdefault("shapes", []).append({
+                "type": "line", "xref": "x", "x0": x, "x1": x,
+                "yref": "y domain", "y0": 0, "y1": 1,
+                "line": {"color": "#3b82f6", "dash": "dash", "width": 2},
+            })
+            layout.setdefault("annotations", []).append({
+                "text": phase["name"], "showarrow": False,
+                "xref": "x", "x": x, "xanchor": "center",
+                "yref": "y domain", "y": 1, "yanchor": "bottom",
+            })
+
+    layout.update(_chart_layout("Behavioral Heatmap (normalized per metric)",
+                                xaxis="Step", height=360,
+                                margin=dict(t=50, b=40, l=120, r=20)))
+    return data, layout
 
 
 def build_phase_chart(
@@ -412,128 +551,141 @@ def build_phase_chart(
         "Closeout": "#f59e0b", "Full Run": "#6b7280",
     }
 
-    fig = go.Figure()
+    data = []
     for p in phases:
         width = p["end_idx"] - p["start_idx"] + 1
-        fig.add_trace(go.Bar(
-            y=["Phase"], x=[width], orientation="h",
-            name=p["name"],
-            marker_color=colors.get(p["name"], "#6b7280"),
-            text=(f"{p['name']}<br>"
-                  f"{p['token_share']}% tok, {p['runtime_share']}% time"),
-            textposition="inside",
-            hovertext=(
+        data.append({
+            "type": "bar",
+            "y": ["Phase"], "x": [width], "orientation": "h",
+            "name": p["name"],
+            "marker": {"color": colors.get(p["name"], "#6b7280")},
+            "text": (f"{p['name']}<br>"
+                     f"{p['token_share']}% tok, {p['runtime_share']}% time"),
+            "textposition": "inside",
+            "hovertext": (
                 f"{p['name']}: idx {p['start_idx']}\u2013{p['end_idx']}, "
                 f"{p['token_share']}% tokens, {p['runtime_share']}% runtime"),
-            hoverinfo="text",
-        ))
+            "hoverinfo": "text",
+        })
 
-    _apply_chart_layout(
-        fig, "Phase Timeline", xaxis="Steps", height=200,
+    layout = _chart_layout(
+        "Phase Timeline", xaxis="Steps", height=200,
         barmode="stack", showlegend=True,
-        legend=dict(orientation="h", yanchor="bottom", y=1.02,
-                    xanchor="center", x=0.5),
+        legend=_H_LEGEND_TIGHT,
     )
-    return fig
+    return _figure(data, layout)
 
 
 def build_context_growth_chart(rows: list[dict],
-                               phases: list[dict] | None = None) -> go.Figure:
-    """Cumulative input tokens (context pressure) with cache-read overlay."""
+                               phases: list[dict] | None = None,
+                               max_points: int | None = RESAMPLE_TARGET) -> go.Figure:
+    """Cumulative input tokens (context pressure) with cache-read overlay.
+
+    Long runs are reduced to *max_points* points as in build_token_chart().
+    """
     if not rows:
         return _empty_figure(340)
 
     indices = [r["index"] for r in rows]
-    cum_input = []
-    cum_fresh = []
-    cum_cache = []
-    ri, rf, rc = 0, 0, 0
-    for r in rows:
-        ri += r.get("tokens_input", 0)
-        cache_read = r.get("cache_read", 0)
-        # rows["non_cache_tokens"] is already schema-normalized in build_message_metrics()
-        rf += r.get("non_cache_tokens", 0)
-        rc += cache_read
-        cum_input.append(ri)
-        cum_fresh.append(rf)
-        cum_cache.append(rc)
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=indices, y=cum_input, name="Cumulative Input",
-        mode="lines+markers",
-        line=dict(color="#2563eb", width=2),
-        marker=dict(size=5),
-        fill="tozeroy", fillcolor="rgba(37,99,235,0.08)",
-        hovertemplate="Step %{x}<br>Cumul. Input: %{y:,}<extra></extra>",
-    ))
-    fig.add_trace(go.Scatter(
-        x=indices, y=cum_fresh, name="Cumul. Fresh Input",
-        mode="lines+markers",
-        line=dict(color="#dc2626", width=2, dash="dot"),
-        marker=dict(size=4),
-        hovertemplate="Step %{x}<br>Cumul. Fresh: %{y:,}<extra></extra>",
-    ))
-    fig.add_trace(go.Scatter(
-        x=indices, y=cum_cache, name="Cumul. Cache Read",
-        mode="lines+markers",
-        line=dict(color="#059669", width=2, dash="dash"),
-        marker=dict(size=4),
-        hovertemplate="Step %{x}<br>Cumul. Cache: %{y:,}<extra></extra>",
-    ))
-    _apply_chart_layout(
-        fig, "Context Growth (Cumulative Input Tokens)",
+    # rows["non_cache_tokens"] is already schema-normalized in build_message_metrics()
+    cum_input, cum_fresh, cum_cache = np.array([
+        (r.get("tokens_input", 0), r.get("non_cache_tokens", 0), r.get("cache_read", 0))
+        for r in rows
+    ]).cumsum(axis=0).T.tolist()
+
+    sel = _resample_indices(cum_input, max_points, keep_top=0)
+    if sel is not None:
+        indices, cum_input, cum_fresh, cum_cache = (
+            _take(lst, sel) for lst in (indices, cum_input, cum_fresh, cum_cache))
+
+    data = [
+        {
+            "type": "scatter",
+            "x": indices, "y": cum_input, "name": "Cumulative Input",
+            "mode": "lines+markers",
+            "line": {"color": "#2563eb", "width": 2},
+            "marker": {"size": 5},
+            "fill": "tozeroy", "fillcolor": "rgba(37,99,235,0.08)",
+            "hovertemplate": "Step %{x}<br>Cumul. Input: %{y:,}<extra></extra>",
+        },
+        {
+            "type": "scatter",
+            "x": indices, "y": cum_fresh, "name": "Cumul. Fresh Input",
+            "mode": "lines+markers",
+            "line": {"color": "#dc2626", "width": 2, "dash": "dot"},
+            "marker": {"size": 4},
+            "hovertemplate": "Step %{x}<br>Cumul. Fresh: %{y:,}<extra></extra>",
+        },
+        {
+            "type": "scatter",
+            "x": indices, "y": cum_cache, "name": "Cumul. Cache Read",
+            "mode": "lines+markers",
+            "line": {"color": "#059669", "width": 2, "dash": "dash"},
+            "marker": {"size": 4},
+            "hovertemplate": "Step %{x}<br>Cumul. Cache: %{y:,}<extra></extra>",
+        },
+    ]
+    layout = _chart_layout(
+        "Context Growth (Cumulative Input Tokens)",
         xaxis="Step", yaxis="Tokens (count)", height=340,
-        legend=dict(orientation="h", yanchor="bottom", y=1.06, xanchor="center", x=0.5),
+        legend=_H_LEGEND,
     )
-    _add_legend_hint(fig)
-    add_phase_overlays(fig, phases, len(rows))
-    return fig
+    _add_legend_hint(layout)
+    add_phase_overlays(layout, phases, len(rows))
+    return _figure(data, layout)
 
 
 def build_tool_duration_chart(steps: list[dict]) -> go.Figure:
     """Grouped bar chart of avg / p95 / max duration per tool type."""
-    from collections import defaultdict
-
-    tool_durs: dict[str, list[float]] = defaultdict(list)
-    for s in steps:
-        for tc in s["tool_calls"]:
-            ts = tc.get("time_start")
-            te = tc.get("time_end")
-            if isinstance(ts, (int, float)) and isinstance(te, (int, float)) and te >= ts:
-                tool_durs[tc["tool_name"]].append((te - ts) / 1000.0)
-
-    if not tool_durs:
+    num = (int, float)
+    timed = tuple(
+        (name, (te - ts) / 1000.0)
+        for name, ts, te in ((tc["tool_name"], tc.get("time_start"), tc.get("time_end"))
+                             for s in steps for tc in s["tool_calls"])
+        if isinstance(ts, num) and isinstance(te, num) and te >= ts
+    )
+    if not timed:
         return _empty_figure(
             300,
             "No tool duration data. Requires time_start / time_end on tool call events.",
         )
+    return _figure(*_tool_duration_payload(timed))
+
 
-    sorted_tools = sorted(tool_durs.keys(),
-                          key=lambda t: statistics.mean(tool_durs[t]), reverse=True)
-    names = sorted_tools
-    avgs = [round(statistics.mean(tool_durs[t]), 3) for t in names]
-    p95s = [round(sorted(tool_durs[t])[min(len(tool_durs[t]) - 1,
-            int(len(tool_durs[t]) * 0.95))], 3) for t in names]
-    maxs = [round(max(tool_durs[t]), 3) for t in names]
-
-    fig = go.Figure()
-    display_names = [n if len(n) <= 30 else n[:27] + "..." for n in names]
-    fig.add_trace(go.Bar(y=display_names, x=avgs, name="Avg (s)", orientation="h",
-                         marker_color="#3b82f6", text=[f"{v:.2f}s" for v in avgs],
-                         textposition="outside", cliponaxis=False))
-    fig.add_trace(go.Bar(y=display_names, x=p95s, name="P95 (s)", orientation="h",
-                         marker_color="#f59e0b", text=[f"{v:.2f}s" for v in p95s],
-                         textposition="outside", cliponaxis=False))
-    fig.add_trace(go.Bar(y=display_names, x=maxs, name="Max (s)", orientation="h",
-                         marker_color="#ef4444", text=[f"{v:.2f}s" for v in maxs],
-                         textposition="outside", cliponaxis=False))
-    max_label = max(len(n) for n in display_names)
-    _apply_chart_layout(
-        fig, "Tool Duration by Type (Avg / P95 / Max)",
+@functools.lru_cache(maxsize=_PAYLOAD_CACHE_SIZE)
+def _tool_duration_payload(timed: tuple) -> tuple[list[dict], dict]:
+    """Build the tool duration chart from (tool_name, seconds) pairs."""
+    tool_durs: dict[str, list[float]] = defaultdict(list)
+    for name, dur in timed:
+        tool_durs[name].append(dur)
+
+    # One array per tool; P95 via partition (O(k)) instead of a full sort.
+    stats: dict[str, tuple[float, float, float]] = {}
+    means: dict[str, float] = {}
+    partition = np.partition
+    for name, durs in tool_durs.items():
+        arr = np.array(durs)
+        k = min(len(arr) - 1, int(len(arr) * 0.95))
+        means[name] = mean = float(arr.mean())
+        stats[name] = (mean, float(partition(arr, k)[k]), float(arr.max()))
+
+    names = sorted(means, key=means.__getitem__, reverse=True)
+    avgs, p95s, maxs = ([round(stats[t][i], 3) for t in names] for i in range(3))
+
+    display_names, max_label = _truncate_labels(names)
+    data = [
+        {"type": "bar", "y": display_names, "x": vals, "name": name, "orientation": "h",
+         "marker": {"color": color}, "text": [f"{v:.2f}s" for v in vals],
+         "textposition": "outside", "cliponaxis": False}
+        for name, vals, color in (("Avg (s)", avgs, "#3b82f6"),
+                                  ("P95 (s)", p95s, "#f59e0b"),
+                                  ("Max (s)", maxs, "#ef4444"))
+    ]
+    layout = _chart_layout(
+        "Tool Duration by Type (Avg / P95 / Max)",
         xaxis="Duration (s)", height=max(280, 60 * len(names)),
         barmode="group",
         margin=dict(l=max(140, max_label * 7 + 20), r=70, t=50, b=40),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+        legend=_H_LEGEND_TIGHT,
     )
-    return fig
+    return data, layout
@@ -1,10 +1,16 @@
 """Data loading, parsing, and aggregate metrics."""
 
+import heapq
 import json
 import os
 import statistics
+from collections import defaultdict
+from operator import itemgetter
 from typing import Any
 
+import numpy as np
+import orjson
+
 
 def safe_get(d: Any, *keys, default=None):
     """Safe nested dict access."""
@@ -16,12 +22,30 @@ def safe_get(d: Any, *keys, default=None):
     return d
 
 
+_EMPTY: dict = {}
+
+
+def _subdict(d: dict, key: str) -> dict:
+    """Return ``d[key]`` if it is a dict, else a shared (read-only) empty dict."""
+    v = d.get(key)
+    return v if isinstance(v, dict) else _EMPTY
+
+
 def load_trajectory(file_path: str) -> dict:
     """Load trajectory JSON with error handling."""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, OSError) as exc:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError as exc:
+        return {"_error": str(exc)}
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        pass
+    # orjson is strict; fall back for NaN/Infinity literals and huge ints
+    try:
+        return json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
         return {"_error": str(exc)}
 
 
@@ -33,9 +57,10 @@ def _percentile(values: list[float], q: float) -> float:
         return min(values)
     if q >= 1:
         return max(values)
-    vals = sorted(values)
-    idx = max(0, min(len(vals) - 1, int((len(vals) - 1) * q)))
-    return vals[idx]
+    n = len(values)
+    idx = max(0, min(n - 1, int((n - 1) * q)))
+    # Select the one rank we need (O(n)) instead of sorting a full copy
+    return np.partition(np.asarray(values), idx)[idx].item()
 
 
 def infer_non_cache_input(
@@ -64,6 +89,67 @@ def infer_non_cache_input(
     return max(0, (input_tokens or 0) - cache_read)
 
 
+def infer_non_cache_input_array(total: np.ndarray, inp: np.ndarray, out: np.ndarray,
+                                reasoning: np.ndarray, cache_read: np.ndarray) -> np.ndarray:
+    """Vectorized infer_non_cache_input() over per-step token columns."""
+    base = inp + out + reasoning
+    input_is_fresh = np.abs(total - (base + cache_read)) <= np.abs(total - base)
+    return np.where(input_is_fresh, np.maximum(inp, 0), np.maximum(inp - cache_read, 0))
+
+
+def _tool_part(p: dict) -> dict:
+    """Normalize a ``tool`` / ``tool_call`` part into a tool-call dict."""
+    state = p.get("state", {})
+    if not isinstance(state, dict):
+        state = {"status": str(state)}
+    state_time = _subdict(state, "time")
+    return {
+        "type": "tool_call", "tool_name": p.get("tool_name", p.get("name", "?")),
+        "tool_id": p.get("tool_id", p.get("id", "")), "status": state.get("status", "?"),
+        "title": state.get("title", ""),
+        "input": state.get("input", p.get("input", {})),
+        "output": state.get("output", p.get("output", "")),
+        "error": p.get("error") or state.get("error") or None,
+        "time_start": state_time.get("start"),
+        "time_end": state_time.get("end"),
+        "metadata": state.get("metadata", {}),
+    }
+
+
+def _step_start_part(p: dict) -> dict:
+    return {"type": "step_start", "name": p.get("name", "")}
+
+
+def _step_finish_part(p: dict) -> dict:
+    return {"type": "step_finish", "name": p.get("name", "")}
+
+
+def _snapshot_part(p: dict) -> dict:
+    return {"type": "snapshot", "data": p.get("data", p.get("snapshot", {}))}
+
+
+def _patch_part(p: dict) -> dict:
+    patch_raw = p.get("raw", p)
+    if not isinstance(patch_raw, dict):
+        patch_raw = {}
+    return {
+        "type": "patch", "hash": patch_raw.get("hash", ""),
+        "files": patch_raw.get("files", []), "id": patch_raw.get("id", ""),
+        "session_id": patch_raw.get("sessionID", ""),
+        "message_id": patch_raw.get("messageID", ""),
+    }
+
+
+# Normalizers for part types that carry no step-level state; text,
+# reasoning and tool parts are handled inline in _parse_parts.
+_PART_HANDLERS = {
+    "step_start": _step_start_part, "step-start": _step_start_part,
+    "step_finish": _step_finish_part, "step-finish": _step_finish_part,
+    "snapshot": _snapshot_part,
+    "patch": _patch_part,
+}
+
+
 def _parse_parts(parts_raw: list) -> tuple[list, list, int, bool, str]:
     """Parse raw parts into structured parts, tool calls, error count, reasoning flag, and preview."""
     parts = []
@@ -83,51 +169,22 @@ def _parse_parts(parts_raw: list) -> tuple[list, list, int, bool, str]:
             if not text_preview:
                 text_preview = txt
         elif ptype == "reasoning":
-            parts.append({"type": "reasoning", "text": p.get("text", "")})
+            txt = p.get("text", "")
+            parts.append({"type": "reasoning", "text": txt})
             has_reasoning = True
             if not text_preview:
-                text_preview = p.get("text", "")
-        elif ptype in ("tool_call", "tool"):
-            state = p.get("state", {})
-            if not isinstance(state, dict):
-                state = {"status": str(state)}
-            tool_name = p.get("tool_name", p.get("name", "?"))
-            status = state.get("status", "?")
-            tc = {
-                "type": "tool_call", "tool_name": tool_name,
-                "tool_id": p.get("tool_id", p.get("id", "")), "status": status,
-                "title": state.get("title", ""),
-                "input": state.get("input", p.get("input", {})),
-                "output": state.get("output", p.get("output", "")),
-                "error": p.get("error") or state.get("error") or None,
-                "time_start": safe_get(state, "time", "start", default=None),
-                "time_end": safe_get(state, "time", "end", default=None),
-                "metadata": state.get("metadata", {}),
-            }
+                text_preview = txt
+        elif ptype == "tool" or ptype == "tool_call":
+            tc = _tool_part(p)
             parts.append(tc)
             tool_calls.append(tc)
-            if status == "error":
+            if tc["status"] == "error":
                 errors += 1
             if not text_preview:
-                text_preview = f"[Tool: {tool_name}] {tc['title']}"
-        elif ptype in ("step_start", "step-start"):
-            parts.append({"type": "step_start", "name": p.get("name", "")})
-        elif ptype in ("step_finish", "step-finish"):
-            parts.append({"type": "step_finish", "name": p.get("name", "")})
-        elif ptype == "snapshot":
-            parts.append({"type": "snapshot", "data": p.get("data", p.get("snapshot", {}))})
-        elif ptype == "patch":
-            patch_raw = p.get("raw", p)
-            if not isinstance(patch_raw, dict):
-                patch_raw = {}
-            parts.append({
-                "type": "patch", "hash": patch_raw.get("hash", ""),
-                "files": patch_raw.get("files", []), "id": patch_raw.get("id", ""),
-                "session_id": patch_raw.get("sessionID", ""),
-                "message_id": patch_raw.get("messageID", ""),
-            })
+                text_preview = f"[Tool: {tc['tool_name']}] {tc['title']}"
         else:
-            parts.append({"type": ptype, "raw": p})
+            handler = _PART_HANDLERS.get(ptype) if isinstance(ptype, str) else None
+            parts.append(handler(p) if handler else {"type": ptype, "raw": p})
 
     return parts, tool_calls, errors, has_reasoning, text_preview
 
@@ -142,23 +199,24 @@ def parse_steps(raw: dict) -> list[dict]:
     for idx, msg in enumerate(trajectory):
         if not isinstance(msg, dict):
             continue
-        info = msg.get("info") if isinstance(msg.get("info"), dict) else {}
-        role = msg.get("role") or safe_get(info, "role", default="?")
+        info = _subdict(msg, "info")
+        info_get = info.get
+        role = msg.get("role") or info_get("role", "?")
 
-        tokens_info = safe_get(info, "tokens", default={})
-        if not isinstance(tokens_info, dict):
-            tokens_info = {}
+        tokens_info = _subdict(info, "tokens")
+        cache_info = _subdict(tokens_info, "cache")
         tokens = {
             "total": tokens_info.get("total", 0) or 0,
             "input": tokens_info.get("input", 0) or 0,
             "output": tokens_info.get("output", 0) or 0,
             "reasoning": tokens_info.get("reasoning", 0) or 0,
-            "cache_read": safe_get(tokens_info, "cache", "read", default=0) or 0,
-            "cache_write": safe_get(tokens_info, "cache", "write", default=0) or 0,
+            "cache_read": cache_info.get("read", 0) or 0,
+            "cache_write": cache_info.get("write", 0) or 0,
         }
 
-        t_created = safe_get(info, "time", "created", default=None)
-        t_completed = safe_get(info, "time", "completed", default=None)
+        time_info = _subdict(info, "time")
+        t_created = time_info.get("created")
+        t_completed = time_info.get("completed")
         duration = None
         if isinstance(t_created, (int, float)) and isinstance(t_completed, (int, float)):
             duration = round((t_completed - t_created) / 1000.0, 2)
@@ -168,25 +226,23 @@ def parse_steps(raw: dict) -> list[dict]:
             raw_parts = []
         parts, tool_calls, errors, has_reasoning, text_preview = _parse_parts(raw_parts)
 
-        finish = safe_get(info, "finish", default="")
-        path_info = safe_get(info, "path", default={})
-        if not isinstance(path_info, dict):
-            path_info = {}
+        finish = info_get("finish", "")
+        path_info = _subdict(info, "path")
         steps.append({
             "index": idx, "role": role, "tokens": tokens, "duration": duration,
             "parts": parts, "tool_calls": tool_calls,
             "tool_call_count": len(tool_calls), "error_count": errors,
             "has_reasoning": has_reasoning, "text_preview": text_preview,
             "finish": finish,
-            "model_id": safe_get(info, "modelID", default=""),
-            "provider_id": safe_get(info, "providerID", default=""),
+            "model_id": info_get("modelID", ""),
+            "provider_id": info_get("providerID", ""),
             "time_created_ms": t_created, "time_completed_ms": t_completed,
-            "agent": safe_get(info, "agent", default=""),
-            "mode": safe_get(info, "mode", default=""),
+            "agent": info_get("agent", ""),
+            "mode": info_get("mode", ""),
             "message_id": msg.get("message_id", ""),
-            "id": safe_get(info, "id", default=""),
-            "parent_id": safe_get(info, "parentID", default=""),
-            "session_id": safe_get(info, "sessionID", default=""),
+            "id": info_get("id", ""),
+            "parent_id": info_get("parentID", ""),
+            "session_id": info_get("sessionID", ""),
             "cwd": path_info.get("cwd", ""), "root": path_info.get("root", ""),
         })
 
@@ -195,21 +251,28 @@ def parse_steps(raw: dict) -> list[dict]:
 
 def build_message_metrics(steps: list[dict]) -> list[dict]:
     """Build per-message metrics used for diagnostics tables and charts."""
+    if not steps:
+        return []
+    tok_rows = [
+        (t.get("total", 0) or 0, t.get("input", 0) or 0, t.get("output", 0) or 0,
+         t.get("reasoning", 0) or 0, t.get("cache_read", 0) or 0)
+        for t in (s.get("tokens", _EMPTY) for s in steps)
+    ]
+    # The derived columns go through NumPy only when every count is an int:
+    # a single float would upcast the whole array and change other rows' types.
+    tok = np.array(tok_rows)
+    if tok.dtype.kind == "i":
+        total, _, _, _, cache = tok.T
+        non_cache_col = infer_non_cache_input_array(*tok.T).tolist()
+        cache_ratio_col = np.divide(cache, total, out=np.zeros(len(steps)),
+                                    where=total != 0).tolist()
+    else:
+        non_cache_col = [infer_non_cache_input(*r) for r in tok_rows]
+        cache_ratio_col = [(c / t) if t else 0.0 for t, _, _, _, c in tok_rows]
+
     rows: list[dict] = []
-    for s in steps:
-        tokens = s.get("tokens", {})
-        tok_total = tokens.get("total", 0) or 0
-        tok_input = tokens.get("input", 0) or 0
-        tok_output = tokens.get("output", 0) or 0
-        tok_reasoning = tokens.get("reasoning", 0) or 0
-        cache_read = tokens.get("cache_read", 0) or 0
-        non_cache = infer_non_cache_input(
-            total_tokens=tok_total,
-            input_tokens=tok_input,
-            output_tokens=tok_output,
-            reasoning_tokens=tok_reasoning,
-            cache_read_tokens=cache_read,
-        )
+    for s, (tok_total, tok_input, tok_output, _, cache_read), non_cache, cache_ratio in zip(
+            steps, tok_rows, non_cache_col, cache_ratio_col):
         duration = s.get("duration")
 
         tool_time_sum = 0.0
@@ -236,7 +299,7 @@ def build_message_metrics(steps: list[dict]) -> list[dict]:
             "tokens_output": tok_output,
             "cache_read": cache_read,
             "non_cache_tokens": non_cache,
-            "cache_ratio": (cache_read / tok_total) if tok_total else 0.0,
+            "cache_ratio": cache_ratio,
             "tokens_per_sec": (tok_total / duration) if duration and duration > 0 else None,
             "non_cache_per_sec": (non_cache / duration) if duration and duration > 0 else None,
             "output_input_ratio": (tok_output / max(1, tok_input)),
@@ -251,11 +314,21 @@ def build_message_metrics(steps: list[dict]) -> list[dict]:
     return rows
 
 
+def _fmt_cell(v: Any, spec: str) -> str:
+    """Format a numeric table cell with *spec*; anything else via str()."""
+    return format(v, spec) if spec and isinstance(v, (int, float)) else str(v)
+
+
+def _fmt_optional(v: float | None, spec: str) -> str:
+    """Format *v* with *spec*, or ``N/A`` when it is missing."""
+    return "N/A" if v is None else format(v, spec)
+
+
 def _build_hotspots_md(rows: list[dict]) -> str:
     """Build markdown tables for top latency/token/cache-miss hotspots."""
-    with_dur = [r for r in rows if r.get("duration") is not None]
-    top_d = sorted(with_dur, key=lambda r: r["duration"], reverse=True)[:5]
-    top_t = sorted(rows, key=lambda r: r["tokens_total"], reverse=True)[:5]
+    top_d = heapq.nlargest(5, (r for r in rows if r.get("duration") is not None),
+                           key=itemgetter("duration"))
+    top_t = heapq.nlargest(5, rows, key=itemgetter("tokens_total"))
 
     def fmt_table(items: list[dict], value_field: str, value_header: str,
                   value_fmt: str, extra_cols: list[tuple[str, str, str]] | None = None) -> str:
@@ -263,19 +336,13 @@ def _build_hotspots_md(rows: list[dict]) -> str:
             return "*No data*"
         extra = extra_cols or [("tokens_total", "Tokens", ","), ("tool_calls", "Tool Calls", "")]
         hdr = " | ".join(h for _, h, _ in extra)
-        lines = [
+        return "\n".join([
             f"| Step | Role | {value_header} | {hdr} |",
             "|---:|---|" + "---:|" * (1 + len(extra)),
-        ]
-        for r in items:
-            v = r[value_field]
-            v_str = format(v, value_fmt) if isinstance(v, (int, float)) else str(v)
-            extras = " | ".join(
-                format(r[f], ef) if isinstance(r[f], (int, float)) and ef else str(r[f])
-                for f, _, ef in extra
-            )
-            lines.append(f"| {r['index']} | `{r['role']}` | {v_str} | {extras} |")
-        return "\n".join(lines)
+            *(f"| {r['index']} | `{r['role']}` | {_fmt_cell(r[value_field], value_fmt)} | "
+              + " | ".join(_fmt_cell(r[f], ef) for f, _, ef in extra) + " |"
+              for r in items),
+        ])
 
     sections = [
         "### Message Hotspots\n\n"
@@ -291,16 +358,14 @@ def _build_hotspots_md(rows: list[dict]) -> str:
     asst_with_tok = [r for r in rows
                      if r.get("role") == "assistant" and r["tokens_total"] > 0]
     if asst_with_tok:
-        low_cache = sorted(asst_with_tok, key=lambda r: r["cache_ratio"])[:5]
+        low_cache = heapq.nsmallest(5, asst_with_tok, key=itemgetter("cache_ratio"))
         lines = [
             "| Step | Role | Cache Read % | Fresh Input | Tokens |",
             "|---:|---|---:|---:|---:|",
+            *(f"| {r['index']} | `{r['role']}` | {r['cache_ratio'] * 100:.1f}% | "
+              f"{r['non_cache_tokens']:,} | {r['tokens_total']:,} |"
+              for r in low_cache),
         ]
-        for r in low_cache:
-            lines.append(
-                f"| {r['index']} | `{r['role']}` | {r['cache_ratio'] * 100:.1f}% | "
-                f"{r['non_cache_tokens']:,} | {r['tokens_total']:,} |"
-            )
         sections.append(
             "\n\n**Lowest cache read steps** (optimization targets)\n\n"
             + "\n".join(lines)
@@ -309,8 +374,12 @@ def _build_hotspots_md(rows: list[dict]) -> str:
     return "".join(sections)
 
 
-def _build_per_message_md(rows: list[dict], limit: int = 80) -> str:
-    """Build a compact per-message diagnostics table."""
+def _build_per_message_md(rows: list[dict], top_k: int = 50) -> str:
+    """Build a compact per-message diagnostics table.
+
+    Long trajectories are capped to the *top_k* messages by total tokens,
+    listed in step order, with a footer counting the rows left out.
+    """
     if not rows:
         return "*No messages parsed.*"
 
@@ -328,28 +397,24 @@ def _build_per_message_md(rows: list[dict], limit: int = 80) -> str:
         )
         lines.append("|---:|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|---|")
 
-    for r in rows[:limit]:
-        dur = "N/A" if r["duration"] is None else f"{r['duration']:.2f}"
-        tokps = "N/A" if r["tokens_per_sec"] is None else f"{r['tokens_per_sec']:.1f}"
-        parts = f"{r['reasoning_parts']}/{r['text_parts']}"
-        finish = _friendly_finish(r['finish']) or '-'
-        if has_agent:
-            agent = r.get("agent", "") or "-"
-            lines.append(
-                f"| {r['index']} | `{r['role']}` | `{agent}` | `{finish}` | {dur} | "
-                f"{r['tokens_total']:,} | {tokps} | {r['cache_ratio'] * 100:.1f}% | "
-                f"{r['non_cache_tokens']:,} | {r['output_input_ratio']:.2f} | {r['tool_calls']} | "
-                f"{r['tool_time_share'] * 100:.2f}% | {parts} |"
-            )
-        else:
-            lines.append(
-                f"| {r['index']} | `{r['role']}` | `{finish}` | {dur} | "
-                f"{r['tokens_total']:,} | {tokps} | {r['cache_ratio'] * 100:.1f}% | "
-                f"{r['non_cache_tokens']:,} | {r['output_input_ratio']:.2f} | {r['tool_calls']} | "
-                f"{r['tool_time_share'] * 100:.2f}% | {parts} |"
-            )
-    if len(rows) > limit:
-        lines.append(f"\n*Showing first {limit} / {len(rows)} messages.*")
+    shown = rows
+    if len(rows) > top_k:
+        shown = heapq.nlargest(top_k, rows, key=lambda r: r["tokens_total"])
+        shown.sort(key=lambda r: r["index"])
+    # The Agent column is the only difference between the two layouts.
+    lines.extend(
+        f"| {r['index']} | `{r['role']}` | "
+        + (f"`{r.get('agent', '') or '-'}` | " if has_agent else "")
+        + f"`{_friendly_finish(r['finish']) or '-'}` | {_fmt_optional(r['duration'], '.2f')} | "
+        f"{r['tokens_total']:,} | {_fmt_optional(r['tokens_per_sec'], '.1f')} | "
+        f"{r['cache_ratio'] * 100:.1f}% | {r['non_cache_tokens']:,} | "
+        f"{r['output_input_ratio']:.2f} | {r['tool_calls']} | "
+        f"{r['tool_time_share'] * 100:.2f}% | {r['reasoning_parts']}/{r['text_parts']} |"
+        for r in shown
+    )
+    if len(rows) > top_k:
+        lines.append(f"\n*Showing the {top_k} highest-token messages; "
+                     f"{len(rows) - top_k} more not shown.*")
     return "\n".join(lines)
 
 
@@ -453,18 +518,54 @@ def _compute_plan_metrics(steps: list[dict]) -> dict:
     }
 
 
-def _compute_token_stats(total_tokens, total_duration, steps, message_rows, raw):
+def _aggregate_rows(message_rows: list[dict]) -> dict:
+    """Collect every per-row total and list compute_metrics needs in one pass."""
+    assistant_tokens: list = []
+    token_rates: list[float] = []
+    cache_ratios: list[float] = []
+    non_cache_total = 0
+    tool_time_total = 0
+    cache_dominant = multi_tool = no_tool = patch_steps = 0
+    for r in message_rows:
+        non_cache_total += r["non_cache_tokens"]
+        tool_time_total += r["tool_time_sum"]
+        if r.get("role") != "assistant":
+            continue
+        tok = r["tokens_total"]
+        assistant_tokens.append(tok)
+        rate = r.get("tokens_per_sec")
+        if rate is not None:
+            token_rates.append(rate)
+        if tok > 0:
+            ratio = r["cache_ratio"]
+            cache_ratios.append(ratio)
+            if ratio >= 0.90:
+                cache_dominant += 1
+        n_tools = r["tool_calls"]
+        if n_tools >= 2:
+            multi_tool += 1
+        elif n_tools == 0:
+            no_tool += 1
+        if r["patch_parts"] > 0:
+            patch_steps += 1
+    return {
+        "assistant_tokens": assistant_tokens, "token_rates": token_rates,
+        "cache_ratios": cache_ratios, "non_cache_total": non_cache_total,
+        "tool_time_total": tool_time_total, "cache_dominant": cache_dominant,
+        "multi_tool": multi_tool, "no_tool": no_tool, "patch_steps": patch_steps,
+    }
+
+
+def _compute_token_stats(total_tokens, total_duration, steps, agg, raw):
     """Token breakdown, throughput, and cache metrics."""
     output = raw.get("output", {}) if isinstance(raw.get("output"), dict) else {}
     session_raw = raw.get("session_raw", {}) if isinstance(raw.get("session_raw"), dict) else {}
     summary = session_raw.get("summary") if isinstance(session_raw.get("summary"), dict) else None
 
-    assistant_rows = [r for r in message_rows if r.get("role") == "assistant"]
-    assistant_tokens = [r["tokens_total"] for r in assistant_rows]
-    token_rates = [r["tokens_per_sec"] for r in assistant_rows if r.get("tokens_per_sec") is not None]
-    cache_ratios = [r["cache_ratio"] for r in assistant_rows if r["tokens_total"] > 0]
-    non_cache_total = sum(r["non_cache_tokens"] for r in message_rows)
-    cache_dominant = sum(1 for r in assistant_rows if r["tokens_total"] > 0 and r["cache_ratio"] >= 0.90)
+    assistant_tokens = agg["assistant_tokens"]
+    token_rates = agg["token_rates"]
+    cache_ratios = agg["cache_ratios"]
+    non_cache_total = agg["non_cache_total"]
     total_io = total_tokens["input"] + total_tokens["output"]
     churn = (summary["additions"] + summary["deletions"]) if summary and "additions" in summary and "deletions" in summary else 0
     return {
@@ -478,8 +579,8 @@ def _compute_token_stats(total_tokens, total_duration, steps, message_rows, raw)
         "p95_step_tokens": round(_percentile(assistant_tokens, 0.95)) if assistant_tokens else 0,
         "median_tokens_per_second": round(statistics.median(token_rates), 1) if token_rates else 0,
         "avg_cache_ratio": round(statistics.mean(cache_ratios) * 100, 1) if cache_ratios else 0,
-        "cache_dominant_steps": cache_dominant,
-        "assistant_steps": len(assistant_rows),
+        "cache_dominant_steps": agg["cache_dominant"],
+        "assistant_steps": len(assistant_tokens),
         "input_tokens": total_tokens["input"],
         "output_tokens": total_tokens["output"],
         "cache_read_tokens": total_tokens["cache_read"],
@@ -492,11 +593,16 @@ def _compute_token_stats(total_tokens, total_duration, steps, message_rows, raw)
     }
 
 
-def _compute_tool_stats(steps, total_tokens_total, total_duration, message_rows):
+_TOOL_FAIL_STATUSES = frozenset(
+    {"error", "failed", "failure", "cancelled", "canceled", "timeout", "timed_out"})
+_TOOL_OK_STATUSES = frozenset({"completed", "success", "succeeded", "ok"})
+
+
+def _compute_tool_stats(steps, total_tokens_total, total_duration, agg):
     """Tool frequency, success rate, duration, and load metrics."""
     tool_count = 0
-    tool_breakdown: dict[str, int] = {}
-    tool_status_breakdown: dict[str, int] = {}
+    tool_breakdown: defaultdict[str, int] = defaultdict(int)
+    tool_status_breakdown: defaultdict[str, int] = defaultdict(int)
     tool_success = 0
     tool_fail = 0
     tool_durations: list[float] = []
@@ -504,25 +610,23 @@ def _compute_tool_stats(steps, total_tokens_total, total_duration, message_rows)
     for s in steps:
         tool_count += s["tool_call_count"]
         for tc in s["tool_calls"]:
-            name = tc["tool_name"]
-            tool_breakdown[name] = tool_breakdown.get(name, 0) + 1
+            tool_breakdown[tc["tool_name"]] += 1
             status = tc.get("status", "unknown")
-            tool_status_breakdown[status] = tool_status_breakdown.get(status, 0) + 1
-            if status in {"error", "failed", "failure", "cancelled", "canceled", "timeout", "timed_out"}:
+            tool_status_breakdown[status] += 1
+            if status in _TOOL_FAIL_STATUSES:
                 tool_fail += 1
-            elif status in {"completed", "success", "succeeded", "ok"}:
+            elif status in _TOOL_OK_STATUSES:
                 tool_success += 1
             ts, te = tc.get("time_start"), tc.get("time_end")
             if isinstance(ts, (int, float)) and isinstance(te, (int, float)) and te >= ts:
                 tool_durations.append((te - ts) / 1000.0)
 
-    assistant_rows = [r for r in message_rows if r.get("role") == "assistant"]
-    tool_time_total = sum(r["tool_time_sum"] for r in message_rows)
+    tool_time_total = agg["tool_time_total"]
     avg_td = statistics.mean(tool_durations) if tool_durations else 0
     return {
         "tool_call_count": tool_count,
-        "tool_breakdown": tool_breakdown,
-        "tool_status_breakdown": tool_status_breakdown,
+        "tool_breakdown": dict(tool_breakdown),
+        "tool_status_breakdown": dict(tool_status_breakdown),
         "tool_success": tool_success,
         "tool_fail": tool_fail,
         "tool_success_rate": round(tool_success / tool_count * 100, 1) if tool_count else 0,
@@ -532,9 +636,9 @@ def _compute_tool_stats(steps, total_tokens_total, total_duration, message_rows)
         "avg_tool_duration": round(avg_td, 3),
         "p95_tool_duration": round(_percentile(tool_durations, 0.95), 3) if tool_durations else 0,
         "max_tool_duration": round(max(tool_durations), 3) if tool_durations else 0,
-        "multi_tool_steps": sum(1 for r in assistant_rows if r["tool_calls"] >= 2),
-        "no_tool_assistant_steps": sum(1 for r in assistant_rows if r["tool_calls"] == 0),
-        "patch_steps": sum(1 for r in assistant_rows if r["patch_parts"] > 0),
+        "multi_tool_steps": agg["multi_tool"],
+        "no_tool_assistant_steps": agg["no_tool"],
+        "patch_steps": agg["patch_steps"],
         "tool_calls_per_min": round(tool_count / (total_duration / 60), 2) if total_duration > 0 else None,
         "tool_time_fraction": round(tool_time_total / total_duration, 4) if total_duration > 0 else None,
         "tool_system_failure_rate": round(tool_fail / tool_count, 4) if tool_count > 0 else None,
@@ -543,22 +647,25 @@ def _compute_tool_stats(steps, total_tokens_total, total_duration, message_rows)
 
 def _compute_efficiency_stats(steps, message_rows, raw):
     """Behavioral, structural, and change-scope metrics."""
-    roles: dict[str, int] = {}
-    agent_breakdown: dict[str, int] = {}
-    model_breakdown: dict[str, int] = {}
-    finish_breakdown: dict[str, int] = {}
+    roles: defaultdict[str, int] = defaultdict(int)
+    agent_breakdown: defaultdict[str, int] = defaultdict(int)
+    model_breakdown: defaultdict[str, int] = defaultdict(int)
+    finish_breakdown: defaultdict[str, int] = defaultdict(int)
     reasoning_parts = text_parts = snapshot_parts = 0
+    asst_durs = []
     for s in steps:
-        roles[s["role"]] = roles.get(s["role"], 0) + 1
+        roles[s["role"]] += 1
+        if s.get("role") == "assistant" and s.get("duration") is not None:
+            asst_durs.append(s["duration"])
         agent = s.get("agent", "")
         if agent:
-            agent_breakdown[agent] = agent_breakdown.get(agent, 0) + 1
+            agent_breakdown[agent] += 1
         model = s.get("model_id", "")
         if model:
-            model_breakdown[model] = model_breakdown.get(model, 0) + 1
+            model_breakdown[model] += 1
         finish = s.get("finish", "")
         if finish:
-            finish_breakdown[finish] = finish_breakdown.get(finish, 0) + 1
+            finish_breakdown[finish] += 1
         for p in s.get("parts", []):
             pt = p.get("type", "")
             if pt == "reasoning":
@@ -572,13 +679,12 @@ def _compute_efficiency_stats(steps, message_rows, raw):
     session_raw = raw.get("session_raw", {}) if isinstance(raw.get("session_raw"), dict) else {}
     summary = session_raw.get("summary") if isinstance(session_raw.get("summary"), dict) else None
     file_status_raw = raw.get("file_status")
-    asst_durs = [s["duration"] for s in steps if s.get("role") == "assistant" and s.get("duration") is not None]
     user_n, asst_n = roles.get("user", 0), roles.get("assistant", 0)
     return {
-        "messages_breakdown": roles,
-        "agent_breakdown": agent_breakdown,
-        "model_breakdown": model_breakdown,
-        "finish_breakdown": finish_breakdown,
+        "messages_breakdown": dict(roles),
+        "agent_breakdown": dict(agent_breakdown),
+        "model_breakdown": dict(model_breakdown),
+        "finish_breakdown": dict(finish_breakdown),
         "reasoning_parts": reasoning_parts,
         "text_parts": text_parts,
         "snapshot_parts": snapshot_parts,
@@ -607,16 +713,22 @@ def compute_metrics(steps: list[dict], raw: dict, message_rows: list[dict] | Non
     if message_rows is None:
         message_rows = build_message_metrics(steps)
 
-    # Duration stats
-    durations = [s["duration"] for s in steps if s.get("duration") is not None]
-    total_duration = sum(durations)
-    total_tokens = {"total": 0, "input": 0, "output": 0, "reasoning": 0,
-                    "cache_read": 0, "cache_write": 0}
+    # Durations and token totals in one pass over steps; per-row aggregates
+    # in one pass over message_rows (_aggregate_rows)
+    durations = []
+    total_tokens = dict.fromkeys(
+        ("total", "input", "output", "reasoning", "cache_read", "cache_write"), 0)
     for s in steps:
+        d = s.get("duration")
+        if d is not None:
+            durations.append(d)
+        tok = s["tokens"]
         for k in total_tokens:
-            total_tokens[k] += s["tokens"].get(k, 0)
+            total_tokens[k] += tok.get(k, 0)
+    total_duration = sum(durations)
 
     timing = raw.get("timing", {}) if isinstance(raw.get("timing"), dict) else {}
+    agg = _aggregate_rows(message_rows)
 
     return {
         "total_steps": len(steps),
@@ -626,8 +738,8 @@ def compute_metrics(steps: list[dict], raw: dict, message_rows: list[dict] | Non
         "p95_duration": round(_percentile(durations, 0.95), 2) if durations else 0,
         "max_duration": round(max(durations), 2) if durations else 0,
         "wall_clock": timing.get("total_duration", total_duration),
-        **_compute_token_stats(total_tokens, total_duration, steps, message_rows, raw),
-        **_compute_tool_stats(steps, total_tokens["total"], total_duration, message_rows),
+        **_compute_token_stats(total_tokens, total_duration, steps, agg, raw),
+        **_compute_tool_stats(steps, total_tokens["total"], total_duration, agg),
         **_compute_efficiency_stats(steps, message_rows, raw),
         **_compute_command_metrics(steps),
         **_compute_timing_metrics(steps, total_tokens["output"]),
@@ -640,7 +752,7 @@ def compute_health_verdict(metrics: dict, step_analytics: list[dict]) -> list[di
     verdicts = []
 
     # Cache efficiency
-    avg_cache = metrics.get("avg_cache_ratio", 0)
+    avg_cache = metrics["avg_cache_ratio"]
     if avg_cache >= 60:
         status, detail = "good", f"Avg cache read {avg_cache}% — strong cache reuse"
     elif avg_cache >= 30:
@@ -650,19 +762,20 @@ def compute_health_verdict(metrics: dict, step_analytics: list[dict]) -> list[di
     verdicts.append({"metric": "Cache Efficiency", "status": status, "label": f"{avg_cache}%", "detail": detail})
 
     # Tool success rate
-    tool_rate = metrics.get("tool_success_rate", 0)
-    tool_count = metrics.get("tool_call_count", 0)
+    tool_rate = metrics["tool_success_rate"]
+    tool_count = metrics["tool_call_count"]
+    tool_fail = metrics["tool_fail"]
     if tool_count == 0:
         verdicts.append({"metric": "Tool Success", "status": "good", "label": "N/A", "detail": "No tool calls"})
     elif tool_rate >= 95:
         verdicts.append({"metric": "Tool Success", "status": "good", "label": f"{tool_rate}%", "detail": f"{tool_rate}% success across {tool_count} calls"})
     elif tool_rate >= 80:
-        verdicts.append({"metric": "Tool Success", "status": "warn", "label": f"{tool_rate}%", "detail": f"{tool_rate}% success — {metrics.get('tool_fail', 0)} failures out of {tool_count} calls"})
+        verdicts.append({"metric": "Tool Success", "status": "warn", "label": f"{tool_rate}%", "detail": f"{tool_rate}% success — {tool_fail} failures out of {tool_count} calls"})
     else:
         verdicts.append({"metric": "Tool Success", "status": "bad", "label": f"{tool_rate}%", "detail": f"{tool_rate}% success — high failure rate across {tool_count} calls"})
 
     # Token efficiency (tok/s)
-    tok_per_s = metrics.get("tokens_per_second", 0)
+    tok_per_s = metrics["tokens_per_second"]
     if tok_per_s >= 50:
         status, detail = "good", f"{tok_per_s} tok/s — strong throughput"
     elif tok_per_s >= 20:
@@ -679,7 +792,7 @@ def compute_health_verdict(metrics: dict, step_analytics: list[dict]) -> list[di
     ))
     # Fallback: count from steps with error_count info
     if error_steps == 0:
-        error_steps = metrics.get("tool_fail", 0)
+        error_steps = tool_fail
     if error_steps == 0:
         status, detail = "good", "No error steps detected"
     elif error_steps <= 2:
@@ -800,23 +913,17 @@ def format_behavioral_md(metrics: dict) -> str:
 def format_output_md(output: dict, metadata: dict, summary: dict,
                      metrics: dict) -> str:
     """Format output & agent stats as markdown."""
-    # Finish breakdown
-    finish_parts = []
-    for fk, fv in sorted(metrics["finish_breakdown"].items(), key=lambda x: -x[1]):
-        finish_parts.append(f"{fv} {fk}")
-    finish_str = ", ".join(finish_parts) if finish_parts else "N/A"
-
-    # Tool status breakdown
-    tool_status_parts = []
-    for sk, sv in sorted(metrics["tool_status_breakdown"].items(), key=lambda x: -x[1]):
-        tool_status_parts.append(f"{sv} {sk}")
-    tool_status_str = ", ".join(tool_status_parts) if tool_status_parts else "N/A"
-
-    # Role breakdown
-    role_parts = []
-    for rk, rv in sorted(metrics["messages_breakdown"].items()):
-        role_parts.append(f"{rv} {rk}")
-    role_str = ", ".join(role_parts) if role_parts else "N/A"
+    finish_str = ", ".join([
+        f"{fv} {fk}"
+        for fk, fv in sorted(metrics["finish_breakdown"].items(), key=lambda x: -x[1])
+    ]) or "N/A"
+    tool_status_str = ", ".join([
+        f"{sv} {sk}"
+        for sk, sv in sorted(metrics["tool_status_breakdown"].items(), key=lambda x: -x[1])
+    ]) or "N/A"
+    role_str = ", ".join([
+        f"{rv} {rk}" for rk, rv in sorted(metrics["messages_breakdown"].items())
+    ]) or "N/A"
 
     # Output detail rows
     output_rows: list[str] = []
@@ -826,9 +933,11 @@ def format_output_md(output: dict, metadata: dict, summary: dict,
             f" {output.get('patch_length', 0):,} chars |"
         )
     if summary:
-        output_rows.append(f"| Files changed | {summary.get('files', 'N/A')} |")
-        output_rows.append(f"| Additions | +{summary.get('additions', 0)} |")
-        output_rows.append(f"| Deletions | -{summary.get('deletions', 0)} |")
+        output_rows += [
+            f"| Files changed | {summary.get('files', 'N/A')} |",
+            f"| Additions | +{summary.get('additions', 0)} |",
+            f"| Deletions | -{summary.get('deletions', 0)} |",
+        ]
     gt_patch = metadata.get("ground_truth_patch", "")
     if gt_patch:
         suffix = "..." if len(gt_patch) > 60 else ""
@@ -857,7 +966,9 @@ def format_output_md(output: dict, metadata: dict, summary: dict,
 
 def wall_clock_fmt(metrics: dict) -> tuple[float, str]:
     """Return (wall_seconds, formatted_string) for wall-clock time."""
-    wall = metrics["wall_clock"] if isinstance(metrics["wall_clock"], (int, float)) else metrics["total_duration"]
+    wall = metrics["wall_clock"]
+    if not isinstance(wall, (int, float)):
+        wall = metrics["total_duration"]
     fmt = f"{wall:.0f}s" if wall < 3600 else f"{wall / 60:.1f}m"
     return wall, fmt
 
@@ -880,17 +991,17 @@ def extract_agent_info(steps: list[dict]) -> tuple[str, str, str]:
     """Return (model_id, provider_id, agent_id) from the first assistant step."""
     model_id = provider_id = agent_id = ""
     for s in steps:
-        if s["role"] == "assistant" and s.get("model_id"):
+        agent = s.get("agent")
+        if not model_id and s["role"] == "assistant" and s.get("model_id"):
             model_id = s["model_id"]
             provider_id = s.get("provider_id", "")
-            if s.get("agent"):
-                agent_id = s["agent"]
+            # The model step's own agent wins over an earlier step's
+            if agent:
+                agent_id = agent
+        elif agent and not agent_id:
+            agent_id = agent
+        if model_id and agent_id:
             break
-    if not agent_id:
-        for s in steps:
-            if s.get("agent"):
-                agent_id = s["agent"]
-                break
     return model_id, provider_id, agent_id
 
 
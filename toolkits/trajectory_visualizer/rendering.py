@@ -1,13 +1,14 @@
 """HTML/code rendering, card styles, and workflow HTML generation."""
 
+import functools
 import html
 import json
 import re
-from datetime import datetime, timezone
+import time
 
+import orjson
 from pygments import highlight as _pygments_highlight
 from pygments.formatters import HtmlFormatter as _HtmlFormatter
-from pygments.lexers import get_lexer_by_name as _get_lexer, TextLexer as _TextLexer
 
 from .styles import WORKFLOW_CSS
 
@@ -24,6 +25,17 @@ _ROLE_BADGE_STYLES = {
     "tool": "background:var(--wf-border-reasoning);color:white;",
 }
 
+# (badge style, display label) per known role, so lookups skip role.title()
+_ROLE_BADGES = {role: (style, role.title()) for role, style in _ROLE_BADGE_STYLES.items()}
+
+
+def _role_badge(role: str) -> tuple[str, str]:
+    """Return (badge_style, label) for a role badge."""
+    return _ROLE_BADGES.get(role) or ("background:#6b7280;color:white;", role.title())
+
+
+_FINAL_FINISH_REASONS = frozenset(("stop", "end_turn"))
+
 
 def _card_style(step: dict) -> tuple[str, str, str]:
     """Return (bg_color, border_color, label) for a step card.
@@ -33,14 +45,13 @@ def _card_style(step: dict) -> tuple[str, str, str]:
     role = step["role"]
     if step["error_count"] > 0:
         return "var(--wf-bg-error)", "var(--wf-border-error)", "Error"
-    if step.get("finish") == "stop" or step.get("finish") == "end_turn":
+    if step.get("finish") in _FINAL_FINISH_REASONS:
         return "var(--wf-bg-final)", "var(--wf-border-final)", "Final"
     if step["tool_call_count"] > 0:
         return "var(--wf-bg-tool)", "var(--wf-border-tool)", "Tool Calls"
     if step["has_reasoning"] and role == "assistant":
         return "var(--wf-bg-reasoning)", "var(--wf-border-reasoning)", "Reasoning"
-    bg, border, label = _ROLE_COLORS.get(role, ("var(--wf-bg-default)", "var(--wf-border-default)", role.title()))
-    return bg, border, label
+    return _ROLE_COLORS.get(role) or ("var(--wf-bg-default)", "var(--wf-border-default)", role.title())
 
 
 _CODE_FENCE_RE = re.compile(
@@ -54,16 +65,49 @@ _CODE_FENCE_RE = re.compile(
 _ORPHAN_FENCE_RE = re.compile(r"`{3,}")
 
 
-_pygments_formatter = _HtmlFormatter(nowrap=True, style="github-dark")
+@functools.cache
+def _pygments_formatter() -> _HtmlFormatter:
+    """Return the shared code-block formatter, built on first use."""
+    return _HtmlFormatter(nowrap=True, style="github-dark")
 
 
-def _highlight_code(code: str, lang: str) -> str:
-    """Syntax-highlight a code string using Pygments."""
+@functools.lru_cache(maxsize=64)
+def _cached_lexer(lang: str):
+    """Return a Pygments lexer for *lang*, falling back to plain text.
+
+    Lexer lookup walks Pygments' alias tables, so instances are reused
+    across fences of the same language.  ``pygments.lexers`` is imported
+    here so views without code fences never load it.
+    """
+    from pygments.lexers import get_lexer_by_name, TextLexer
+
     try:
-        lexer = _get_lexer(lang, stripall=True)
+        return get_lexer_by_name(lang, stripall=True)
     except Exception:
-        lexer = _TextLexer(stripall=True)
-    return _pygments_highlight(code, lexer, _pygments_formatter)
+        return TextLexer(stripall=True)
+
+
+# Texts and code blocks longer than this are rendered without going through
+# the LRU caches, so those caches stay bounded in memory.
+_PREVIEW_CACHE_MAX_CHARS = 8192
+
+
+def _highlight_code(code: str, lang: str) -> str:
+    """Syntax-highlight a code string using Pygments (memoized per code/lang).
+
+    Only blocks up to _PREVIEW_CACHE_MAX_CHARS are cached.
+    """
+    if len(code) > _PREVIEW_CACHE_MAX_CHARS:
+        return _render_highlight(code, lang)
+    return _cached_highlight(code, lang)
+
+
+def _render_highlight(code: str, lang: str) -> str:
+    """Syntax-highlight a code string using Pygments."""
+    return _pygments_highlight(code, _cached_lexer(lang), _pygments_formatter())
+
+
+_cached_highlight = functools.lru_cache(maxsize=256)(_render_highlight)
 
 
 def _neutralize_orphan_fences(text: str) -> str:
@@ -73,6 +117,8 @@ def _neutralize_orphan_fences(text: str) -> str:
     spaces) so they render visibly but never open a code fence in markdown-it.
     Only call this on segments already known to be *outside* balanced fences.
     """
+    if "```" not in text:
+        return text
     return _ORPHAN_FENCE_RE.sub(
         lambda m: "\u200b".join("`" for _ in range(len(m.group()))),
         text,
@@ -104,11 +150,26 @@ def _escape_html_outside_fences(text: str) -> str:
 
 
 def _md_to_html_preview(text: str) -> str:
+    """Convert text with markdown fenced code blocks to HTML (memoized).
+
+    Re-rendering a trajectory, or switching between steps, hits the same
+    texts repeatedly; only texts up to _PREVIEW_CACHE_MAX_CHARS are cached
+    to keep the cache's memory bounded.
+    """
+    if len(text) > _PREVIEW_CACHE_MAX_CHARS:
+        return _render_md_preview(text)
+    return _cached_md_preview(text)
+
+
+def _render_md_preview(text: str) -> str:
     """Convert text with markdown fenced code blocks to HTML.
 
     Code fences (```lang ... ```) become syntax-highlighted <pre><code> blocks.
     Everything else is html-escaped.  Orphan backtick fences are neutralized.
     """
+    if "```" not in text:
+        # No fence (balanced or orphan) can occur, so plain escaping is exact
+        return html.escape(text)
     parts: list[str] = []
     last_end = 0
     for m in _CODE_FENCE_RE.finditer(text):
@@ -118,10 +179,10 @@ def _md_to_html_preview(text: str) -> str:
         lang = m.group(1) or "text"
         code = m.group(2).rstrip("\n")
         highlighted = _highlight_code(code, lang)
-        lang_escaped = html.escape(lang)
+        # lang is \w* from _CODE_FENCE_RE (or "text"), so it needs no escaping
         parts.append(
             f'<div class="wf-code-block">'
-            f'<span class="wf-code-lang">{lang_escaped}</span>'
+            f'<span class="wf-code-lang">{lang}</span>'
             f'<pre class="wf-code-hl"><code>{highlighted}</code></pre>'
             f'</div>'
         )
@@ -132,6 +193,21 @@ def _md_to_html_preview(text: str) -> str:
     return "".join(parts) if parts else html.escape(text)
 
 
+_cached_md_preview = functools.lru_cache(maxsize=512)(_render_md_preview)
+
+
+# Part types shown as icons on a card, as bit flags; _PART_ICON_STRS maps every
+# flag combination to its sorted, joined label string.
+_PART_ICON_BITS = {"text": 1, "reasoning": 2, "tool_call": 4}
+_PART_ICON_STRS = tuple(
+    " \u00b7 ".join(sorted(label for bit, label in ((1, "text"), (2, "thought"), (4, "tool"))
+                           if flags & bit))
+    for flags in range(8)
+)
+
+_CARD_CONNECTOR = '\n<div class="wf-connector"></div>\n'
+
+
 def render_workflow_html(steps: list[dict]) -> str:
     """Render vertical card flow as self-contained HTML with scroll container."""
     if not steps:
@@ -146,28 +222,23 @@ def render_workflow_html(steps: list[dict]) -> str:
         tok = f"{step['tokens']['total']:,}"
         preview = _md_to_html_preview(step["text_preview"]) if step["text_preview"] else "\u2014"
 
-        part_icons = []
+        icon_bits = 0
         for p in step["parts"]:
             t = p.get("type", "")
-            if t == "reasoning":
-                part_icons.append("thought")
-            elif t == "tool_call":
-                part_icons.append("tool")
-            elif t == "text":
-                part_icons.append("text")
-        icon_str = " \u00b7 ".join(sorted(set(part_icons))) if part_icons else ""
+            if isinstance(t, str):          # passthrough parts may carry any JSON value
+                icon_bits |= _PART_ICON_BITS.get(t, 0)
+        icon_str = _PART_ICON_STRS[icon_bits]
 
         tc_info = f'<span>{step["tool_call_count"]} tool(s)</span>' if step["tool_call_count"] else ''
         err_info = f'<span style="color:var(--wf-border-error)">{step["error_count"]} err</span>' if step["error_count"] else ''
         agent_badge = ''
-        if step.get("agent"):
+        if agent := step.get("agent"):
             agent_badge = (
                 f'<span class="wf-badge" style="background:var(--wf-bg-user);color:var(--wf-border-user);'
-                f'border:1px solid var(--wf-border-user);font-size:9px;">{html.escape(step["agent"])}</span>'
+                f'border:1px solid var(--wf-border-user);font-size:9px;">{html.escape(agent)}</span>'
             )
         role = step["role"]
-        role_style = _ROLE_BADGE_STYLES.get(role, "background:#6b7280;color:white;")
-        role_label = role.title()
+        role_style, role_label = _role_badge(role)
 
         orig_idx = step.get("index", i)
         card = f"""
@@ -189,13 +260,11 @@ def render_workflow_html(steps: list[dict]) -> str:
         </div>
         """
         cards_html.append(card)
-        if i < len(steps) - 1:
-            cards_html.append('<div class="wf-connector"></div>')
 
     return (
         css
         + '<div class="wf-scroll"><div class="wf-container">'
-        + "\n".join(cards_html)
+        + _CARD_CONNECTOR.join(cards_html)
         + '</div></div>'
     )
 
@@ -204,69 +273,74 @@ def _fmt_timestamp(ms):
     """Convert epoch-milliseconds to readable ``YYYY-MM-DD HH:MM:SS`` (UTC)."""
     if not isinstance(ms, (int, float)):
         return None
-    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    t = time.gmtime(ms / 1000)
+    return "%04d-%02d-%02d %02d:%02d:%02d" % (
+        t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+_OPTIONAL_META_FIELDS = (
+    ("agent", "Agent"), ("mode", "Mode"), ("model_id", "Model"),
+    ("provider_id", "Provider"),
+)
+_ID_META_FIELDS = (
+    ("id", "ID"), ("parent_id", "Parent ID"), ("session_id", "Session"),
+    ("cwd", "CWD"), ("message_id", "Message ID"),
+)
+
+
+def _meta_row(field: str, value: str) -> str:
+    """Render one ``<tr>`` of the step metadata table."""
+    escaped_val = html.escape(str(value))
+    # Wrap code-like values
+    if any(c in value for c in ("/", ".", "-")) and len(value) > 8:
+        escaped_val = f"<code>{escaped_val}</code>"
+    return f"<tr><td>{html.escape(field)}</td><td>{escaped_val}</td></tr>"
 
 
 def _format_step_header(step: dict) -> str:
     """Build the styled HTML header banner and metadata table for a step detail panel."""
     bg, border, label = _card_style(step)
     role = step["role"]
-    role_style = _ROLE_BADGE_STYLES.get(role, "background:#6b7280;color:white;")
-
-    rows: list[tuple[str, str]] = [("Role", step['role'])]
-    _optional = [
-        ("agent", "Agent"), ("mode", "Mode"), ("model_id", "Model"),
-        ("provider_id", "Provider"),
-    ]
-    for key, field in _optional:
-        if step.get(key):
-            rows.append((field, step[key]))
-    if step.get("duration") is not None:
-        rows.append(("Duration", f"{step['duration']}s"))
+    role_style, role_label = _role_badge(role)
+
+    rows = [_meta_row("Role", step['role'])]
+    for key, field in _OPTIONAL_META_FIELDS:
+        if value := step.get(key):
+            rows.append(_meta_row(field, value))
+    if (duration := step.get("duration")) is not None:
+        rows.append(_meta_row("Duration", f"{duration}s"))
 
     created_str = _fmt_timestamp(step.get("time_created_ms"))
     if created_str:
-        rows.append(("Created", created_str))
+        rows.append(_meta_row("Created", created_str))
     completed_str = _fmt_timestamp(step.get("time_completed_ms"))
     if completed_str:
-        rows.append(("Completed", completed_str))
+        rows.append(_meta_row("Completed", completed_str))
 
-    if step.get("finish"):
-        rows.append(("Finish", step["finish"]))
-    if step["tool_call_count"] > 0:
-        rows.append(("Tool calls", str(step["tool_call_count"])))
-    if step["error_count"] > 0:
-        rows.append(("Errors", str(step["error_count"])))
-
-    _id_fields = [
-        ("id", "ID"), ("parent_id", "Parent ID"), ("session_id", "Session"),
-        ("cwd", "CWD"), ("message_id", "Message ID"),
-    ]
-    for key, field in _id_fields:
-        if step.get(key):
-            rows.append((field, step[key]))
-    if step.get("root") and step.get("root") != step.get("cwd"):
-        rows.append(("Root", step["root"]))
+    if finish := step.get("finish"):
+        rows.append(_meta_row("Finish", finish))
+    if (tool_call_count := step["tool_call_count"]) > 0:
+        rows.append(_meta_row("Tool calls", str(tool_call_count)))
+    if (error_count := step["error_count"]) > 0:
+        rows.append(_meta_row("Errors", str(error_count)))
+
+    for key, field in _ID_META_FIELDS:
+        if value := step.get(key):
+            rows.append(_meta_row(field, value))
+    if (root := step.get("root")) and root != step.get("cwd"):
+        rows.append(_meta_row("Root", root))
 
     # Banner
+    index = step["index"]
     banner = (
         f"<div class='dp-header' style='background:{border};'>"
-        f"<span class='dp-badge'>#{step['index']}</span>"
-        f"<span class='dp-badge' style='{role_style}'>{html.escape(role.title())}</span>"
-        f"Step {step['index']} &mdash; {html.escape(label)}"
+        f"<span class='dp-badge'>#{index}</span>"
+        f"<span class='dp-badge' style='{role_style}'>{html.escape(role_label)}</span>"
+        f"Step {index} &mdash; {html.escape(label)}"
         f"</div>"
     )
 
-    # Metadata table
-    tr_parts = []
-    for field, value in rows:
-        escaped_val = html.escape(str(value))
-        # Wrap code-like values
-        if any(c in value for c in ("/", ".", "-")) and len(value) > 8:
-            escaped_val = f"<code>{escaped_val}</code>"
-        tr_parts.append(f"<tr><td>{html.escape(field)}</td><td>{escaped_val}</td></tr>")
-
-    table = f"<table class='dp-meta-table'>{''.join(tr_parts)}</table>"
+    table = f"<table class='dp-meta-table'>{''.join(rows)}</table>"
     return banner + table
 
 
@@ -284,40 +358,65 @@ def _safe_fence(text: str, lang: str = "") -> str:
     return f"{fence}{lang}\n{text}\n{fence}"
 
 
+_OUTPUT_CAP = 2000
+_TRUNCATED_SUFFIX = "\n... (truncated)"
+
+
+def _json_dumps(obj, cap: int | None = None) -> str:
+    """Pretty-print *obj* as JSON with 2-space indents, via orjson when possible.
+
+    With *cap*, the text is cut to *cap* characters plus a truncation marker,
+    and only the UTF-8 prefix that can reach the cap is decoded.
+    """
+    try:
+        raw = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # orjson rejects ints beyond 64 bits and some key types; json copes
+        text = json.dumps(obj, indent=2, ensure_ascii=False)
+    else:
+        if cap is not None:
+            # cap characters span at most 4 * cap bytes; a cut multi-byte
+            # character at the end of the slice is dropped by "ignore"
+            raw = raw[:4 * cap + 4]
+        text = raw.decode("utf-8", "ignore")
+    if cap is not None and len(text) > cap:
+        text = text[:cap] + _TRUNCATED_SUFFIX
+    return text
+
+
 def _format_tool_call_detail(p: dict) -> str:
     """Render a single tool_call part as a styled HTML block."""
     inp = p.get("input", {})
     out = p.get("output", "")
-    inp_str = json.dumps(inp, indent=2, ensure_ascii=False) if isinstance(inp, dict) else str(inp)
-    if isinstance(out, str) and len(out) > 2000:
-        out = out[:2000] + "\n... (truncated)"
+    inp_str = _json_dumps(inp) if isinstance(inp, dict) else str(inp)
+    if isinstance(out, str) and len(out) > _OUTPUT_CAP:
+        out = out[:_OUTPUT_CAP] + _TRUNCATED_SUFFIX
     elif isinstance(out, dict):
-        out = json.dumps(out, indent=2, ensure_ascii=False)
-        if len(out) > 2000:
-            out = out[:2000] + "\n... (truncated)"
+        out = _json_dumps(out, cap=_OUTPUT_CAP)
 
     tc_dur = ""
-    if p.get("time_start") and p.get("time_end"):
-        tc_dur = f" &mdash; {round((p['time_end'] - p['time_start']) / 1000, 2)}s"
+    if (time_start := p.get("time_start")) and (time_end := p.get("time_end")):
+        tc_dur = f" &mdash; {round((time_end - time_start) / 1000, 2)}s"
 
     meta_parts: list[str] = []
     tool_id = p.get("tool_id", "")
     if tool_id:
         meta_parts.append(f"<code>{html.escape(tool_id)}</code>")
-    tc_meta = p.get("metadata") or {}
-    handled = {"output", "input", "preview"}
-    if isinstance(tc_meta, dict):
-        if tc_meta.get("sessionId"):
-            sid = str(tc_meta["sessionId"])
+    tc_meta = p.get("metadata")
+    # Most simple tools carry no metadata; skip the whole block for them
+    if tc_meta and isinstance(tc_meta, dict):
+        handled = {"output", "input", "preview"}
+        if session_id := tc_meta.get("sessionId"):
+            sid = str(session_id)
             display = f"{sid[:16]}\u2026" if len(sid) > 16 else sid
             meta_parts.append(f"Session: <code>{html.escape(display)}</code>")
             handled.add("sessionId")
         meta_model = tc_meta.get("model")
         if isinstance(meta_model, dict):
-            if meta_model.get("modelID"):
-                meta_parts.append(f"Model: <code>{html.escape(str(meta_model['modelID']))}</code>")
-            if meta_model.get("providerID"):
-                meta_parts.append(f"Provider: <code>{html.escape(str(meta_model['providerID']))}</code>")
+            if model_id := meta_model.get("modelID"):
+                meta_parts.append(f"Model: <code>{html.escape(str(model_id))}</code>")
+            if provider_id := meta_model.get("providerID"):
+                meta_parts.append(f"Provider: <code>{html.escape(str(provider_id))}</code>")
             handled.add("model")
         elif meta_model:
             meta_parts.append(f"Model: <code>{html.escape(str(meta_model))}</code>")
@@ -333,8 +432,8 @@ def _format_tool_call_detail(p: dict) -> str:
             if isinstance(mv, str) and len(mv) > 60:
                 mv = mv[:57] + "..."
             meta_parts.append(f"{html.escape(mk)}: <code>{html.escape(str(mv))}</code>")
-    if isinstance(inp, dict) and inp.get("subagent_type"):
-        meta_parts.append(f"Subagent: <code>{html.escape(str(inp['subagent_type']))}</code>")
+    if isinstance(inp, dict) and (subagent := inp.get("subagent_type")):
+        meta_parts.append(f"Subagent: <code>{html.escape(str(subagent))}</code>")
 
     meta_line = f"<div class='dp-tool-meta'>{' &middot; '.join(meta_parts)}</div>" if meta_parts else ""
 
@@ -345,22 +444,10 @@ def _format_tool_call_detail(p: dict) -> str:
     status = html.escape(p.get("status", "?"))
     title = html.escape(p.get("title") or "Untitled")
 
-    # Input/Output details
-    inp_detail = (
-        f"<details class='dp-details'><summary>Input</summary>"
-        f"<div class='dp-details-body'><pre>{html.escape(inp_str)}</pre></div>"
-        f"</details>"
-    )
-    out_detail = (
-        f"<details class='dp-details'><summary>Output</summary>"
-        f"<div class='dp-details-body'><pre>{html.escape(str(out))}</pre></div>"
-        f"</details>"
-    )
-
     error_detail = ""
     tc_error = p.get("error")
     if tc_error:
-        err_str = tc_error if isinstance(tc_error, str) else json.dumps(tc_error, indent=2, ensure_ascii=False)
+        err_str = tc_error if isinstance(tc_error, str) else _json_dumps(tc_error)
         error_detail = (
             f"<details class='dp-details' open><summary>Error</summary>"
             f"<div class='dp-details-body'><pre>{html.escape(err_str)}</pre></div>"
@@ -374,7 +461,14 @@ def _format_tool_call_detail(p: dict) -> str:
         f"<code>{status}</code>{tc_dur}</div>"
         f"<div style='font-weight:600;margin-bottom:4px;color:var(--ov-text);'>{title}</div>"
         f"{meta_line}"
-        f"{inp_detail}{out_detail}{error_detail}"
+        # Input/Output bodies go straight into the final string (no intermediate copies)
+        f"<details class='dp-details'><summary>Input</summary>"
+        f"<div class='dp-details-body'><pre>{html.escape(inp_str)}</pre></div>"
+        f"</details>"
+        f"<details class='dp-details'><summary>Output</summary>"
+        f"<div class='dp-details-body'><pre>{html.escape(str(out))}</pre></div>"
+        f"</details>"
+        f"{error_detail}"
         f"</div>"
     )
 
@@ -420,9 +514,12 @@ def _format_patch_section(p: dict) -> str:
 def format_step_detail(step: dict) -> str:
     """Format detail panel for a selected step as a single HTML string."""
     header = _format_step_header(step)
+    parts = step["parts"]
+    if not parts:
+        return header + "<em>No content</em>"
 
     content_parts = []
-    for p in step["parts"]:
+    for p in parts:
         ptype = p.get("type", "unknown")
         if ptype == "text":
             content_parts.append(_format_text_section(p, "text"))